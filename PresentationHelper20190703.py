@@ -1,7 +1,20 @@
 """
 This module includes tools for marketing presentation drawings. 
 """
+from __future__ import print_function
+
+import contextlib
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+import types
+from array import array
+
 import rhinoscriptsyntax as rs
+import scriptcontext as sc
 
 DRAWING_NAME = 'Plan Level 1' #This is only for users to know which drawing they are working on
 WHAT_TO_DO = 12
@@ -36,9 +49,10 @@ Edit the number to specify which definition to run
     Extend every curve in the each group to a closest curve in the selection at each end.
     New curves will stay in the same group.
     Non-curves will not be transformed.
-    Curves(polylines, nurb curves) that are not line segments will be transformed to line segments.
+    Curves(polylines, nurb curves) that are not line segments will be transformed to line segments, 
+    joined again if EXTEND_REJOIN.
     Note: The definition may fail on some occasions to make a collectively enclosed outline for the purpose of CurveBoolean
-          Not recommended to be operated on complicated or large numbers of geometries as it might take very long to run
+          Each end first examines the EXTEND_NEAREST curves nearest to it within EXTEND_MAX_RADIUS
 
 [6]Delete Empty Layers.
     Unused block definitions will be purged.
@@ -192,6 +206,79 @@ LEGEND_MARKETING_LINE_LAYERS = {'NorthArrow_Bold':{'display_color':(0,0,0), 'pri
                                 'PrintFrame':{'display_color':(0,0,0), 'print_color':(0,0,0), 'print_width':0.01}
                                 }
 
+ANCHOR_CACHE_FILE = os.path.join(os.path.expanduser('~'), 'PresentationHelper_anchor_cache.json')
+ANCHOR_CACHE_SIZE = 20000
+"""
+A file to keep the anchor points of block definitions between runs of "Replace Same Blocks".
+Definitions are identified by their geometry rather than their names, so the same family 
+exported in another drawing or under another name is found in the file.
+When the file holds more than ANCHOR_CACHE_SIZE definitions, the least recently used are dropped.
+Set ANCHOR_CACHE_FILE to None to not use the file.
+
+Format: ANCHOR_CACHE_FILE = 'C:\\Path\\To\\anchor_cache.json'
+        ANCHOR_CACHE_SIZE = 20000
+"""
+
+PROFILE_RS_CALLS = False
+"""
+Set to True to count and time every rhinoscriptsyntax call made by the definition that runs, 
+by the function making the call. The calls are printed by their total time when the definition ends.
+
+Format: PROFILE_RS_CALLS = True
+"""
+
+PARALLEL_WORKERS = 1
+"""
+The number of threads (in Rhino) or processes (in CPython) that share the work of 
+"Select Overlapping Lines" in large drawings and of "Extend curves to Closest Others" on many groups. 
+1 runs everything in one thread.
+
+Format: PARALLEL_WORKERS = 4
+"""
+
+REPLACE_COMMIT = False
+"""
+Set to True to have "Replace Same Blocks" delete the replaced block instances and 
+purge the block definitions no longer used, instead of keeping them in the group "Old" for review.
+
+Format: REPLACE_COMMIT = True
+"""
+
+HATCH_COLOR_TOLERANCE = 2.3
+"""
+The largest difference (CIE76 delta E, where 2.3 is about the smallest difference people notice) between 
+a hatch color and the nearest color in HATCH_COLORS for the hatch to be sorted as that color. 
+It lets the colors exported a unit off by Revit be sorted. 0 only sorts the exact colors.
+
+Format: HATCH_COLOR_TOLERANCE = 5.0
+"""
+
+EXTEND_MAX_RADIUS = None
+"""
+The farthest a curve end is extended by "Extend curves to Closest Others", in model units. 
+Curves farther from an end are not examined for it. None examines the curves at any distance.
+
+Format: EXTEND_MAX_RADIUS = 24.0
+"""
+
+EXTEND_NEAREST = 16
+"""
+The number of curves nearest to each curve end examined first by "Extend curves to Closest Others", 
+so that large groups take time in proportion to their size. Farther curves are only examined for an end 
+whose target is not nearer than them, so the curves are extended as if all of them were examined.
+None examines all the curves in the group at once.
+
+Format: EXTEND_NEAREST = 16
+"""
+
+EXTEND_REJOIN = False
+"""
+Set to True to have "Extend curves to Closest Others" join the extended segments of each polyline or curve 
+again, instead of leaving them as lines.
+
+Format: EXTEND_REJOIN = True
+"""
+
 
 
 
@@ -212,55 +299,131 @@ def find_blocks():
     a set of block instances' Guids
     """
     block_set = set([])
+    matcher = _make_keyword_matcher([(keyword, keyword) for keyword in BLOCKS_KEYWORD])
     for block_name in rs.BlockNames():
         # for block_obj in rs.BlockObjects(block_name):
             # if rs.IsBlock(block_obj):
                 # for a_block in set(rs.BlockInstances(block_name)):
                     # rs.ExplodeBlockInstance(a_block)
         
-        for block_keyword in BLOCKS_KEYWORD:
-            if block_keyword.upper() in block_name.upper():
-                set_add = set(rs.BlockInstances(block_name))
+        if _match_keywords(matcher, block_name):
+            set_add = set(rs.BlockInstances(block_name))
 
-                block_set = block_set.union(set_add)
+            block_set = block_set.union(set_add)
                 
     rs.SelectObjects(block_set)
     return block_set
 
     
-def block_to_group(block_id):
+def block_to_group(block_id, template_dict=None):
     """
     Convert a block to a group. Compatible with nested block instances
     
     Arguments:
     block_id -- Guid of a block instance
+    template_dict[opt] -- [dict]the exploded block definitions shared between calls, 
+                          see _explode_block_instance()
     
     Returns:
     The group name of the previous block
     """    
     if rs.IsBlockInstance(block_id):
-        return_group = []
-        object_ids = list(rs.ExplodeBlockInstance(block_id))
+        if template_dict is None:
+            template_dict = {}
         
-        # Iterate over the objects that were in the block instance
-        for obj in object_ids:
+        object_ids, spans = _explode_block_instance(block_id, template_dict)
         
-            # If a block instance, use recursion to convert block instance to a group
-            # Add object ids in the group to the list for group to return
-            if rs.IsBlockInstance(obj):
-                sub_group_name = block_to_group(obj)
-                sub_ids = rs.ObjectsByGroup(sub_group_name)
-                return_group.extend(sub_ids)
-            
-            # Otherwise add object to the list for group to return
-            else:
-                return_group.append(obj)
-        
-        # Create a group of the objects in the block instance
+        # Create a group of the objects of each nested block instance, then of the whole block instance
+        for start, end in spans:
+            rs.AddObjectsToGroup(object_ids[start:end], rs.AddGroup())
         new_group_name = rs.AddGroup()
-        rs.AddObjectsToGroup(return_group, new_group_name)
+        rs.AddObjectsToGroup(object_ids, new_group_name)
         
         return new_group_name
+
+
+def _explode_block_instance(block_id, template_dict):
+    """
+    Explode a block instance and the block instances nested in it.
+    
+    The first instance of each block definition is exploded and kept in template_dict with its transform. 
+    The later instances of the definition are copies of those objects, taken out of the groups the first 
+    instance was put in and transformed from the first instance to them, so a definition is exploded only 
+    once however many times it is inserted. A definition with objects that take their attributes from 
+    the instance (by parent) is exploded once for each set of instance attributes instead.
+    
+    Arguments:
+    block_id -- Guid of a block instance
+    template_dict -- [dict]each block name mapped to (whether the definition has objects by parent, 
+                     a dictionary of the instance attributes, see _instance_attributes(), or None 
+                     to (inverse transform of the first instance, its exploded object ids, its spans))
+    
+    Returns:
+    A tuple of the list of exploded object ids, and a list of (start, end) of the object ids of 
+    each nested block instance in it, inner ones first
+    """
+    block_name = rs.BlockInstanceName(block_id)
+    xform = rs.BlockInstanceXform(block_id)
+    
+    if block_name not in template_dict:
+        template_dict[block_name] = (_has_by_parent_objects(block_name), {})
+    by_parent, templates = template_dict[block_name]
+    key = _instance_attributes(block_id) if by_parent else None
+    
+    if key in templates:
+        inverse, t_ids, t_spans = templates[key]
+        
+        # A first instance scaled to nothing cannot be transformed back, explode instead
+        if inverse:
+            object_ids = rs.TransformObjects(t_ids, rs.XformMultiply(xform, inverse), copy=True)
+            # The copies are in the groups of the first instance's objects
+            for obj in object_ids:
+                rs.RemoveObjectFromAllGroups(obj)
+            rs.DeleteObject(block_id)
+            return object_ids, t_spans
+    
+    object_ids = []
+    spans = []
+    for obj in rs.ExplodeBlockInstance(block_id):
+        if rs.IsBlockInstance(obj):
+            sub_ids, sub_spans = _explode_block_instance(obj, template_dict)
+            offset = len(object_ids)
+            spans.extend([(offset + start, offset + end) for start, end in sub_spans])
+            object_ids.extend(sub_ids)
+            spans.append((offset, len(object_ids)))
+        else:
+            object_ids.append(obj)
+    
+    if key not in templates:
+        templates[key] = (rs.XformInverse(xform), object_ids, spans)
+    
+    return object_ids, spans
+
+
+def _has_by_parent_objects(block_name):
+    """
+    Returns True if an object of a block definition takes its color, linetype, print color or 
+    print width from the block instance (by parent), so that its exploded attributes depend on the instance.
+    """
+    for obj in rs.BlockObjects(block_name):
+        if 3 in (rs.ObjectColorSource(obj), rs.ObjectLinetypeSource(obj), 
+                 rs.ObjectPrintColorSource(obj), rs.ObjectPrintWidthSource(obj)):
+            return True
+    
+    return False
+
+
+def _instance_attributes(block_id):
+    """
+    Returns a tuple of the attributes of a block instance that objects by parent take.
+    """
+    color = rs.ObjectColor(block_id)
+    print_color = rs.ObjectPrintColor(block_id)
+    
+    return (rs.ObjectLayer(block_id), (color.R, color.G, color.B), rs.ObjectColorSource(block_id), 
+            rs.ObjectLinetype(block_id), rs.ObjectLinetypeSource(block_id), 
+            (print_color.R, print_color.G, print_color.B), rs.ObjectPrintColorSource(block_id), 
+            rs.ObjectPrintWidth(block_id), rs.ObjectPrintWidthSource(block_id))
     
 def blocks_to_groups(block_set=set([])):
     """
@@ -284,8 +447,11 @@ def blocks_to_groups(block_set=set([])):
     # Initialize an empty list for the group names of converted block instances
     group_lst = []
     
+    # Block definitions exploded so far, shared by all the block instances
+    template_dict = {}
+    
     for a_block in block_set:
-        group_name = block_to_group(a_block)
+        group_name = block_to_group(a_block, template_dict)
         group_lst.append(group_name)
         
     return group_lst
@@ -325,9 +491,97 @@ def set_layers(a_dict):
         else:
             rs.LayerPrintWidth(new_layer, -1)
 
+def _make_doc_snapshot():
+    """
+    Read the objects in the document in one pass, so that operations can look them up 
+    without querying the document again. Objects moved with _snapshot_move() are updated in place.
+    
+    Arguments:
+    None
+    
+    Returns:
+    A snapshot dictionary of:
+    'objects' -- each object[Guid] mapped to a dictionary of its 'type', 'is_text', 'layer', 'parent', 
+                 'color'[(R, G, B)], 'linetype', 'linetype_by_layer', 'normal' (the object itself visible 
+                 and not locked) and 'selectable' (normal and on a visible, unlocked layer)
+    'layers' -- each layer name mapped to a dictionary of its 'parent', 'linetype' and 'selectable'
+    """
+    snapshot = {'objects':{}, 'layers':{}}
+    
+    for layer_name in rs.LayerNames():
+        _snapshot_layer(snapshot, layer_name)
+    
+    normal_objs = set(rs.NormalObjects())
+    
+    for obj in rs.AllObjects():
+        obj_type = rs.ObjectType(obj)
+        layer_name = rs.ObjectLayer(obj)
+        layer = _snapshot_layer(snapshot, layer_name)
+        color = rs.ObjectColor(obj)
+        normal = obj in normal_objs
+        
+        snapshot['objects'][obj] = {'type':obj_type, 
+                                    'is_text':obj_type == 512 and rs.IsText(obj), 
+                                    'layer':layer_name, 
+                                    'parent':layer['parent'], 
+                                    'color':(color.R, color.G, color.B), 
+                                    'linetype':rs.ObjectLinetype(obj), 
+                                    'linetype_by_layer':rs.ObjectLinetypeSource(obj) == 0, 
+                                    'normal':normal, 
+                                    'selectable':normal and layer['selectable']}
+    
+    return snapshot
+
+
+def _snapshot_layer(snapshot, layer_name):
+    """
+    Returns the properties of a layer in a snapshot, reading them from the document the first time.
+    """
+    if layer_name not in snapshot['layers']:
+        parent = rs.ParentLayer(layer_name)
+        selectable = rs.IsLayerVisible(layer_name) and not rs.IsLayerLocked(layer_name)
+        if parent:
+            selectable = selectable and _snapshot_layer(snapshot, parent)['selectable']
+        
+        snapshot['layers'][layer_name] = {'parent':parent, 
+                                          'linetype':rs.LayerLinetype(layer_name), 
+                                          'selectable':selectable}
+    
+    return snapshot['layers'][layer_name]
+
+
+def _snapshot_move(snapshot, obj_ids, layer_name):
+    """
+    Move objects to a layer with one call and update the snapshot accordingly.
+    
+    Arguments:
+    snapshot -- [dict]snapshot returned by _make_doc_snapshot()
+    obj_ids -- [Guid] of the objects to move
+    layer_name -- [str]name of the layer to move the objects to
+    
+    Returns:
+    None
+    """
+    obj_ids = list(obj_ids)
+    if not obj_ids:
+        return
+    
+    rs.ObjectLayer(obj_ids, layer_name)
+    layer = _snapshot_layer(snapshot, layer_name)
+    
+    for obj in obj_ids:
+        record = snapshot['objects'][obj]
+        record['layer'] = layer_name
+        record['parent'] = layer['parent']
+        record['selectable'] = record['normal'] and layer['selectable']
+        if record['linetype_by_layer']:
+            record['linetype'] = layer['linetype']
+
+
 def move_to_layers():
     """
     Move objects on layers with keywords to corresponding rhino layers as indicated in REVIT_LAYERS
+    Each layer is moved to one standard layer, see _resolve_layer_target().
     
     Arguments:
     None
@@ -344,31 +598,65 @@ def move_to_layers():
     
     all_layers = layer_examine
     
-    for layer_move_to, keyword_set in REVIT_LAYERS.items():
-        # Examine each keyword indicating objects should be moved to the specified standard layer
-        for keyword in keyword_set:
-            # Iterate over all layer names to find those containing the keyword
-            for layer_name in all_layers:
-            
-                # Move the objects on the layer with the keyword to its corresponding standard layer
-                if keyword.upper() in layer_name.upper():
-                    obj_lst = rs.ObjectsByLayer(layer_name)
-                    rs.ObjectLayer(obj_lst, DRAWING_NAME+'::Linework_'+ layer_move_to)
+    # Find the keywords in each layer's name at once and resolve them to one standard layer
+    matcher = _make_keyword_matcher([(keyword, (keyword, layer_move_to)) for layer_move_to, keyword_set in REVIT_LAYERS.items() 
+                                     for keyword in keyword_set])
+    target_dict = {}
+    for layer_name in sorted(all_layers):
+        layer_move_to = _resolve_layer_target(_match_keywords(matcher, layer_name))
+        if layer_move_to is not None:
+            target_dict.setdefault(layer_move_to, []).append(layer_name)
+    
+    # Move the objects on all the layers of a standard layer at once
+    for layer_move_to in sorted(target_dict):
+        obj_lst = []
+        for layer_name in target_dict[layer_move_to]:
+            obj_lst.extend(rs.ObjectsByLayer(layer_name))
+        
+        if obj_lst:
+            rs.ObjectLayer(obj_lst, DRAWING_NAME+'::Linework_'+ layer_move_to)
+
+
+def _resolve_layer_target(matches):
+    """
+    Choose one standard layer for a layer whose name contains keywords of several standard layers in REVIT_LAYERS.
+    The longest keyword wins. Between keywords of the same length, the standard layer with the larger 
+    print width in MARKETING_LINE_LAYERS wins, then the first standard layer by name.
+    
+    Arguments:
+    matches -- [set]pairs of (keyword, standard layer name) found in the layer's name
+    
+    Returns:
+    The name of the standard layer, or None if there are no matches
+    """
+    best = None
+    best_key = None
+    for keyword, layer_move_to in matches:
+        print_width = MARKETING_LINE_LAYERS.get(layer_move_to, {}).get('print_width', 0)
+        key = (-len(keyword), -print_width, layer_move_to)
+        if best_key is None or key < best_key:
+            best = layer_move_to
+            best_key = key
+    
+    return best
 
 
 def move_label_to_layer(label_set=None):
     """
-    Move text objects to label layer.
+    Move text objects that are not on the sub-layers to label layer.
     
     Arguments:
-    label_set -- [opt][set]Guid of text objects
+    label_set -- [opt][set]Guid of text objects. If omitted, all visible and not locked text objects will be examined
     
     Returns:
     None
     """
-    rs.Command('SelText')
-    text_lst = rs.SelectedObjects()
-    rs.UnselectAllObjects()
+    if label_set:
+        text_lst = label_set
+    else:
+        rs.Command('SelText')
+        text_lst = rs.SelectedObjects()
+        rs.UnselectAllObjects()
     
     text_to_move = []
     for text in text_lst:
@@ -376,7 +664,7 @@ def move_label_to_layer(label_set=None):
             text_to_move.append(text)
             
     if text_to_move:
-        rs.ObjectLayer(text_lst, DRAWING_NAME+'::'+'Linework_Label')
+        rs.ObjectLayer(text_to_move, DRAWING_NAME+'::'+'Linework_Label')
 
 
 def set_dash_lines(crvs=None):
@@ -406,8 +694,7 @@ def set_dash_lines(crvs=None):
     crvs = crvs_examine
     
     for crv in crvs:
-        crv_linetype = rs.ObjectLinetype(crv)
-        if crv_linetype == 'Continuous':
+        if rs.ObjectLinetype(crv) == 'Continuous':
             cont.add(crv)
         
             
@@ -415,16 +702,23 @@ def set_dash_lines(crvs=None):
     dashed = crvs.difference(cont)
     
     # Move dashed curves to difference layers depending on where they are(and what they represent)
+    furniture_hidden = []
+    dashed_1 = []
     for crv in dashed:
         if 'Furniture' in rs.ObjectLayer(crv):
-            rs.ObjectLayer(crv, DRAWING_NAME+'::'+'Linework_Furniture_Hidden')
+            furniture_hidden.append(crv)
         else:
-            rs.ObjectLayer(crv, DRAWING_NAME+'::'+'Linework_1_Dashed')
+            dashed_1.append(crv)
+    
+    for crv_lst, layer_name in ((furniture_hidden, DRAWING_NAME+'::'+'Linework_Furniture_Hidden'), 
+                                (dashed_1, DRAWING_NAME+'::'+'Linework_1_Dashed')):
+        if crv_lst:
+            rs.ObjectLayer(crv_lst, layer_name)
 
 def sort_color_hatches(hatch_set=None):
     """
     Move hatches to standard rhino layers as specified in HATCH_COLORS.
-    Hatches of colors not in HATCH_COLORS will not be moved.
+    Hatches of colors not in HATCH_COLORS, nor within HATCH_COLOR_TOLERANCE of one, will not be moved.
     
     Arguments:
     hatch_set -- [opt][set]Guids of hatches. If omitted, all visible hatches 
@@ -445,33 +739,172 @@ def sort_color_hatches(hatch_set=None):
     
     hatch_set = hatch_examine
     
-    if hatch_set:
-        # Iterate over the hatch color mapping
-        for layer_name, props in HATCH_COLORS.items():
-            
-            # Find hatches with each specified color
-            color_set = set(rs.ObjectsByColor(props['display_color']))
-            hatches = list(hatch_set.intersection(color_set))
-            # Move these hatches to corresponding standard layers
-            rs.ObjectLayer(hatches, DRAWING_NAME+'::'+'Color_'+layer_name)
+    # Read the color of each hatch once and find its standard layer
+    color_table = _make_hatch_color_table()
+    target_dict = {}
+    for a_hatch in hatch_set:
+        color = rs.ObjectColor(a_hatch)
+        color = (color.R, color.G, color.B)
+        layer_name = _match_hatch_color(color_table, color)
+        if layer_name is not None:
+            target_dict.setdefault(layer_name, []).append(a_hatch)
+    
+    # Move the hatches of each standard layer at once
+    for layer_name in sorted(target_dict):
+        rs.ObjectLayer(target_dict[layer_name], layer_name)
 
 
-def purge_not_used_blocks():
+def _make_hatch_color_table(tolerance=HATCH_COLOR_TOLERANCE):
     """
-    Delete blocks without any instances in the document
+    Make the lookup of the standard layers of hatch colors used by _match_hatch_color().
     
     Arguments:
-    None
+    tolerance[opt] -- [num]the largest CIE76 delta E between a color and the nearest color in HATCH_COLORS 
+                      for the color to be matched
     
     Returns:
-    None
+    A dictionary of 'colors', each color[(R, G, B)] matched so far mapped to its standard layer or None,
+    'palette', a list of (CIELAB color, standard layer) of HATCH_COLORS, and 'tolerance'
+    """
+    # A color in several programs ends on the last one, as moving the hatches one program after another did
+    color_dict = {}
+    for layer_name, props in HATCH_COLORS.items():
+        color_dict[tuple(props['display_color'])] = DRAWING_NAME+'::'+'Color_'+layer_name
+    
+    palette = [(_rgb_to_lab(color), layer_name) for color, layer_name in sorted(color_dict.items())]
+    
+    return {'colors':color_dict, 'palette':palette, 'tolerance':tolerance}
+
+
+def _match_hatch_color(color_table, color):
+    """
+    Find the standard layer of a hatch color: the layer of the same color in HATCH_COLORS, or else 
+    the layer of the nearest color in CIELAB within the tolerance. 
+    The palette is small, so the nearest color is found by comparing them all, once per color.
+    
+    Arguments:
+    color_table -- [dict]lookup returned by _make_hatch_color_table(), remembering the colors matched
+    color -- [tuple](R, G, B) of the hatch
+    
+    Returns:
+    The name of the standard layer, or None if no color in HATCH_COLORS is near enough
+    """
+    color = tuple(color)
+    if color not in color_table['colors']:
+        lab = _rgb_to_lab(color)
+        best = None
+        best_dist = None
+        for palette_lab, layer_name in color_table['palette']:
+            dist = math.sqrt(sum([(lab[i] - palette_lab[i])**2 for i in range(3)]))
+            if best_dist is None or dist < best_dist:
+                best = layer_name
+                best_dist = dist
+        if best_dist is None or best_dist > color_table['tolerance']:
+            best = None
+        color_table['colors'][color] = best
+    
+    return color_table['colors'][color]
+
+
+def _rgb_to_lab(color):
+    """
+    Convert an sRGB color[(R, G, B) of 0-255] to CIELAB under D65 light.
+    """
+    f_lst = []
+    linear = []
+    for value in color[:3]:
+        value = value/255.0
+        if value > 0.04045:
+            linear.append(((value + 0.055)/1.055)**2.4)
+        else:
+            linear.append(value/12.92)
+    r, g, b = linear
+    
+    for x, white in ((0.4124*r + 0.3576*g + 0.1805*b, 0.95047), 
+                     (0.2126*r + 0.7152*g + 0.0722*b, 1.0), 
+                     (0.0193*r + 0.1192*g + 0.9505*b, 1.08883)):
+        x = x/white
+        if x > 0.008856:
+            f_lst.append(x**(1/3.0))
+        else:
+            f_lst.append(7.787*x + 16/116.0)
+    fx, fy, fz = f_lst
+    
+    return (116*fy - 16, 500*(fx - fy), 200*(fy - fz))
+
+
+def purge_not_used_blocks(block_dict=None):
+    """
+    Delete blocks without any instances in the document, or only nested in other blocks to delete
+    
+    Arguments:
+    block_dict[opt] -- [dict]the block definitions returned by _scan_block_definitions().
+                       If omitted, the block definitions are scanned.
+    
+    Returns:
+    A set of the names of the blocks deleted
     """
-    all_blocks = rs.BlockNames()
+    if block_dict is None:
+        block_dict = _scan_block_definitions()
+    
+    # Mark the blocks inserted in the document and the blocks nested in them, at any depth
+    used_set = set([])
+    to_visit = [rs.BlockInstanceName(obj) for obj in rs.ObjectsByType(4096)]
+    while to_visit:
+        block_name = to_visit.pop()
+        if block_name not in used_set and block_name in block_dict:
+            used_set.add(block_name)
+            to_visit.extend(block_dict[block_name]['nested'])
+    
+    # Count the not used blocks nesting each not used block
+    not_used_set = set(block_dict) - used_set
+    container_count = dict([(block_name, 0) for block_name in not_used_set])
+    for block_name in not_used_set:
+        for nested_name in block_dict[block_name]['nested']:
+            if nested_name in container_count:
+                container_count[nested_name] += 1
+    
+    # Delete a block after all the blocks nesting it
+    to_delete = [block_name for block_name, count in container_count.items() if not count]
+    deleted_set = set([])
+    while to_delete:
+        block_name = to_delete.pop()
+        if not rs.DeleteBlock(block_name):
+            continue
+        deleted_set.add(block_name)
+        for nested_name in block_dict[block_name]['nested']:
+            if nested_name in container_count:
+                container_count[nested_name] -= 1
+                if not container_count[nested_name]:
+                    to_delete.append(nested_name)
+    
+    return deleted_set
+
+
+def _scan_block_definitions():
+    """
+    Read the block definitions in one pass.
+    
+    Arguments:
+    None
     
-    for block_name in all_blocks:
-        if not rs.BlockInstanceCount(block_name):
-            rs.DeleteBlock(block_name)
+    Returns:
+    A dictionary of each block name to a dictionary of 'nested', a set of the names of 
+    the blocks inserted in it, and 'layers', each layer name mapped to the number of its objects on the layer
+    """
+    block_dict = {}
+    for block_name in rs.BlockNames():
+        nested_set = set([])
+        layer_count = {}
+        for obj in rs.BlockObjects(block_name):
+            if rs.IsBlockInstance(obj):
+                nested_set.add(rs.BlockInstanceName(obj))
+            layer_name = rs.ObjectLayer(obj)
+            layer_count[layer_name] = layer_count.get(layer_name, 0) + 1
+        block_dict[block_name] = {'nested':nested_set, 'layers':layer_count}
     
+    return block_dict
+
 
 def purge_empty_layers():
     """
@@ -483,33 +916,51 @@ def purge_empty_layers():
     Returns:
     None
     """
-    purge_not_used_blocks()
+    block_dict = _scan_block_definitions()
+    deleted_blocks = purge_not_used_blocks(block_dict)
     rs.CurrentLayer(DRAWING_NAME)
-    all_layers = rs.LayerNames()
-    parent_set = set([])
     
-    # Iterate all layers
+    # Count the objects on each layer, in the document and in the blocks kept
+    layer_count = {}
+    for obj in rs.AllObjects():
+        layer_name = rs.ObjectLayer(obj)
+        layer_count[layer_name] = layer_count.get(layer_name, 0) + 1
+    for block_name, props in block_dict.items():
+        if block_name not in deleted_blocks:
+            for layer_name, count in props['layers'].items():
+                layer_count[layer_name] = layer_count.get(layer_name, 0) + count
+    
+    # Build the layer tree from the full layer names
+    all_layers = rs.LayerNames()
+    children_dict = dict([(layer_name, []) for layer_name in all_layers])
+    root_lst = []
     for layer_name in all_layers:
-        
-        # Examine the layers with no children
-        if not rs.LayerChildCount(layer_name):
-            # If the layer has a parent and is empty(successfully deleted),
-            # add the parent to the set to examine in the next step
-            layer_parent = rs.ParentLayer(layer_name)
-            if rs.DeleteLayer(layer_name) and layer_parent:
-                parent_set.add(layer_parent)
-    
-    # Examine all layers put into the set
-    while parent_set:
-        layer_name = parent_set.pop()
-        
-        # Examine the layers with no other children
-        if not rs.LayerChildCount(layer_name):
-            # If the layer has a parent and is empty(successfully deleted),
-            # add the parent to the set to examine in the next step
-            layer_parent = rs.ParentLayer(layer_name)
-            if rs.DeleteLayer(layer_name) and layer_parent and layer_parent:
-                parent_set.add(layer_parent)
+        if '::' in layer_name and layer_name.rsplit('::', 1)[0] in children_dict:
+            children_dict[layer_name.rsplit('::', 1)[0]].append(layer_name)
+        else:
+            root_lst.append(layer_name)
+    
+    # The current layer and its parents cannot be deleted
+    keep_set = set([])
+    layer_name = rs.CurrentLayer()
+    while layer_name:
+        keep_set.add(layer_name)
+        layer_name = rs.ParentLayer(layer_name)
+    
+    # Visit the children before their parent, and delete a layer if 
+    # it is empty and all its children were deleted
+    deleted_set = set([])
+    stack = [(layer_name, False) for layer_name in root_lst]
+    while stack:
+        layer_name, children_visited = stack.pop()
+        if not children_visited:
+            stack.append((layer_name, True))
+            stack.extend([(child, False) for child in children_dict[layer_name]])
+        elif (layer_name not in keep_set and not layer_count.get(layer_name) and 
+              all([child in deleted_set for child in children_dict[layer_name]]) and 
+              rs.DeleteLayer(layer_name)):
+            deleted_set.add(layer_name)
+
 
 def organize_layers():
     """
@@ -524,17 +975,25 @@ def organize_layers():
     
     set_layers(MARKETING_LINE_LAYERS)
     set_layers(HATCH_COLORS)
-    move_label_to_layer()
-    move_to_layers()
-    sort_color_hatches()
     
-    set_dash_lines()
+    # Read the document once, find the final layer of every object, then move the objects by layer
+    snapshot = _make_doc_snapshot()
+    rules = _compile_organize_rules(snapshot)
     
-    for layer in rs.LayerNames():
-		objs = rs.ObjectsByLayer(layer)
-		rs.ObjectColorSource(objs, 0)
-		rs.ObjectPrintColorSource(objs, 0)
-		rs.ObjectPrintWidthSource(objs, 0)
+    target_dict = {}
+    for obj, record in snapshot['objects'].items():
+        layer_name = _classify_object(snapshot, rules, record)
+        if layer_name != record['layer']:
+            target_dict.setdefault(layer_name, []).append(obj)
+    
+    for layer_name in sorted(target_dict):
+        _snapshot_move(snapshot, target_dict[layer_name], layer_name)
+    
+    objs = list(snapshot['objects'])
+    if objs:
+        rs.ObjectColorSource(objs, 0)
+        rs.ObjectPrintColorSource(objs, 0)
+        rs.ObjectPrintWidthSource(objs, 0)
 	
 #    rs.Command('SelAll')
 #    objs = rs.GetObjects(preselect=True)
@@ -545,6 +1004,70 @@ def organize_layers():
 #    
 
     
+def _compile_organize_rules(snapshot):
+    """
+    Compile the keywords of REVIT_LAYERS and the colors of HATCH_COLORS into lookups that 
+    _classify_object() applies to one object.
+    
+    Arguments:
+    snapshot -- [dict]snapshot returned by _make_doc_snapshot()
+    
+    Returns:
+    A dictionary of 'layer_targets', each top layer with keywords in REVIT_LAYERS mapped to its standard layer, 
+    and 'hatch_colors', the lookup of the standard layers of hatch colors returned by _make_hatch_color_table()
+    """
+    matcher = _make_keyword_matcher([(keyword, (keyword, layer_move_to)) for layer_move_to, keyword_set in REVIT_LAYERS.items() 
+                                     for keyword in keyword_set])
+    layer_targets = {}
+    for layer_name, layer in snapshot['layers'].items():
+        if not layer['parent']:
+            layer_move_to = _resolve_layer_target(_match_keywords(matcher, layer_name))
+            if layer_move_to is not None:
+                layer_targets[layer_name] = DRAWING_NAME+'::Linework_'+ layer_move_to
+    
+    return {'layer_targets':layer_targets, 'hatch_colors':_make_hatch_color_table()}
+
+
+def _classify_object(snapshot, rules, record):
+    """
+    Find the layer an object ends on after organize_layers() moves it: texts to the label layer, objects 
+    on layers with keywords to the standard layers, hatches by color, then dashed curves to the dashed layers. 
+    Each rule sees the layer the rules before it chose.
+    
+    Arguments:
+    snapshot -- [dict]snapshot returned by _make_doc_snapshot()
+    rules -- [dict]lookups returned by _compile_organize_rules()
+    record -- [dict]the object's record in the snapshot
+    
+    Returns:
+    The name of the layer
+    """
+    layer_name = record['layer']
+    
+    if record['type'] == 512 and record['is_text'] and record['selectable'] and not record['parent']:
+        layer_name = DRAWING_NAME+'::'+'Linework_Label'
+    
+    layer_name = rules['layer_targets'].get(layer_name, layer_name)
+    layer = _snapshot_layer(snapshot, layer_name)
+    
+    if record['type'] == 65536 and record['selectable'] and not layer['parent']:
+        layer_name = _match_hatch_color(rules['hatch_colors'], record['color']) or layer_name
+        layer = _snapshot_layer(snapshot, layer_name)
+    
+    if record['type'] == 4 and record['selectable'] and layer['parent'] == DRAWING_NAME:
+        if record['linetype_by_layer']:
+            linetype = layer['linetype']
+        else:
+            linetype = record['linetype']
+        if linetype != 'Continuous':
+            if 'Furniture' in layer_name:
+                layer_name = DRAWING_NAME+'::'+'Linework_Furniture_Hidden'
+            else:
+                layer_name = DRAWING_NAME+'::'+'Linework_1_Dashed'
+    
+    return layer_name
+
+
 def _init_crv_extend_lst(crvs):
     """
     Initialize and return a list for the mappings of each curve.
@@ -649,110 +1172,537 @@ def _make_crv_extend_lst(crv_dist_lst, crv_lst):
     return crv_dist_lst
 
 
-def extend_to_closest(crvs):
+def _find_extend_candidates(endpoints, max_radius=None, nearest=None):
     """
-    Extend each curve in the specified collection to others that are closest to its ends respectively.
+    Find the segments near the ends of each segment, in a grid index of the segments, 
+    growing the search ring by ring around each end until the nearest ones are known.
     
     Arguments:
-    crvs -- Guids of curves to be extended
+    endpoints -- the columns of end point coordinates returned by _table_endpoints()
+    max_radius[opt] -- [num]the largest distance from an end to a segment found. If omitted, any distance
+    nearest[opt] -- [int]the number of segments found for each end, the nearest first. If omitted, all of them
     
     Returns:
-    [str]The name of the new curves group
+    A list of the sorted indices of the segments found near either end of each segment
+    A list of the distances from the start and the end of each segment under which every segment was found
+    The grid index searched, see _make_extend_grid()
     """
-    if crvs:
-        crv_dist_lst, crv_lst, non_crvs = _init_crv_extend_lst(crvs)
-        crv_dist_lst = _make_crv_extend_lst(crv_dist_lst, crv_lst)
-        _extend_crv_dict(crv_dist_lst)
-        
-        crv_lst.extend(non_crvs)
+    search = _make_extend_grid(endpoints, max_radius)
+    starts, ends = search[3], search[4]
+    
+    candidate_lst = []
+    reach_lst = []
+    for index in range(len(starts)):
+        found = set()
+        reach = []
+        for pt in (starts[index], ends[index]):
+            indices, pt_reach = _nearest_segments(search, pt, index, max_radius, nearest)
+            found.update(indices)
+            reach.append(pt_reach)
+        candidate_lst.append(sorted(found))
+        reach_lst.append(reach)
+    
+    return candidate_lst, reach_lst, search
 
-        new_group = rs.AddGroup()
-        rs.AddObjectsToGroup(crv_lst, new_group)
 
-        return new_group
-                        
-def _extend_crv_dict(crv_dist_lst):
+def _make_extend_grid(endpoints, max_radius=None):
     """
-    Implement curve extension according to the list of curve extension dictionaries
+    Put segments into a grid index for _nearest_segments().
     
     Arguments:
-    crv_dist_lst -- a list of curve extension mappings
+    endpoints -- the columns of end point coordinates returned by _table_endpoints()
+    max_radius[opt] -- [num]the largest distance searched around a point, used to size the cells
     
     Returns:
-    None
+    A tuple of the grid returned by _make_segment_grid(), its cell size, the (min i, min j, max i, max j) 
+    of its cells, and the lists of the start and end points of the segments
     """
-    for crv_dict in crv_dist_lst:
-        # iterate over every curve mapping in the list
-        # Examine curve start and end respectively
-        # Extend curve to curve or curve to point, depending on the target types
-        if crv_dict['start_target'] and crv_dict['min_dist_start'] != 0:
-            if type(crv_dict['start_target']) == type(crv_dict['crv_id']):
-                rs.ExtendCurve(crv_dict['crv_id'], 0, 0, [crv_dict['start_target']])
-            elif not rs.IsPointOnCurve(crv_dict['crv_id'], crv_dict['start_target']):
-                rs.ExtendCurvePoint(crv_dict['crv_id'], 0, crv_dict['start_target'])
-                
-        if crv_dict['end_target'] and crv_dict['min_dist_end'] != 0:
-            if type(crv_dict['end_target']) == type(crv_dict['crv_id']):
-                rs.ExtendCurve(crv_dict['crv_id'], 0, 1, [crv_dict['end_target']])
-            elif not rs.IsPointOnCurve(crv_dict['crv_id'], crv_dict['end_target']):
-                rs.ExtendCurvePoint(crv_dict['crv_id'], 1, crv_dict['end_target'])
+    x0, y0, z0, x1, y1, z1 = endpoints
+    count = len(x0)
+    starts = [(x0[i], y0[i], z0[i]) for i in range(count)]
+    ends = [(x1[i], y1[i], z1[i]) for i in range(count)]
+    
+    bboxes = [_segment_bbox(starts[i], ends[i]) for i in range(count)]
+    cell_size = _grid_cell_size(bboxes, (max_radius or 0)/4.0 or 1e-6)
+    grid = _make_segment_grid(bboxes, cell_size)
+    extent = (min([cell[0] for cell in grid] or [0]), min([cell[1] for cell in grid] or [0]), 
+              max([cell[0] for cell in grid] or [0]), max([cell[1] for cell in grid] or [0]))
+    
+    return grid, cell_size, extent, starts, ends
 
 
-def extend_to_closest_group(objs):
+def _nearest_segments(search, pt, exclude, max_radius=None, nearest=None):
     """
-    Operate extend_to_closest() on each of the curve groups selected
+    Find the segments nearest to a point in a grid index. See _find_extend_candidates().
     
     Arguments:
-    objs -- [Guid] of objects
+    search -- [tuple]grid index of the segments returned by _make_extend_grid()
+    pt -- the point to search around
+    exclude -- [int]the index of a segment not to find
+    max_radius[opt] -- [num]the largest distance from the point to a segment found
+    nearest[opt] -- [int]the number of segments to find
     
     Returns:
-    None
+    A list of the indices of the segments found, the nearest first
+    The distance from the point under which every segment within max_radius was found
     """
-    groups = set() 
-    for obj in objs:
-        if rs.ObjectGroups(obj):
-            for group_name in rs.ObjectGroups(obj):
-                groups.add(group_name)
-                
-    for group_name in groups:
-        crvs = rs.ObjectsByGroup(group_name)
-        extend_to_closest(crvs)
+    grid, cell_size, extent, starts, ends = search
+    ci, cj = int(pt[0]//cell_size), int(pt[1]//cell_size)
+    seen = set([exclude])
+    dist_lst = []
+    ring = 0
+    
+    while True:
+        for i in range(ci - ring, ci + ring + 1):
+            for j in range(cj - ring, cj + ring + 1):
+                if max(abs(i - ci), abs(j - cj)) != ring or (i, j) not in grid:
+                    continue
+                for index in grid[(i, j)]:
+                    if index not in seen:
+                        seen.add(index)
+                        dist = _point_segment_distance(pt, starts[index], ends[index])
+                        if max_radius is None or dist <= max_radius:
+                            dist_lst.append((dist, index))
+        
+        # The segments not seen yet are farther than the cells searched
+        reach = ring*cell_size
+        if max_radius is not None and reach >= max_radius:
+            reach = float('+inf')
+            break
+        if nearest and len([dist for dist, index in dist_lst if dist <= reach]) >= nearest:
+            break
+        if ci - ring <= extent[0] and cj - ring <= extent[1] and ci + ring >= extent[2] and cj + ring >= extent[3]:
+            reach = float('+inf')
+            break
+        ring += 1
+    
+    dist_lst.sort()
+    if nearest and len(dist_lst) > nearest:
+        reach = min(reach, dist_lst[nearest][0])
+        dist_lst = dist_lst[:nearest]
+    
+    return [index for dist, index in dist_lst], reach
+
+
+def _point_segment_distance(pt, start, end):
+    """
+    Returns the distance from a point to a segment, on coordinates.
+    """
+    vx, vy, vz = end[0] - start[0], end[1] - start[1], end[2] - start[2]
+    wx, wy, wz = pt[0] - start[0], pt[1] - start[1], pt[2] - start[2]
+    vv = vx*vx + vy*vy + vz*vz
+    t = 0.0
+    if vv:
+        t = min(1.0, max(0.0, (vx*wx + vy*wy + vz*wz)/vv))
+    ox, oy, oz = wx - vx*t, wy - vy*t, wz - vz*t
+    
+    return math.sqrt(ox*ox + oy*oy + oz*oz)
 
-def verify_parallel(crv_start, crv_end, crv2_start, crv2_end):
+
+def _find_extend_targets(endpoints, tolerance, candidate_lst=None, max_radius=None):
     """
-    Verify if two specified curves are parallel
+    Examine each segment with every other segment to find out where each end should be extended to,
+    in the same way as _make_crv_extend_lst() but on coordinates only.
     
     Arguments:
-    crv -- Guid of one curve to be examined
-    crv2 -- Guid of the other curve to be examined
+    endpoints -- the columns of end point coordinates returned by _table_endpoints()
+    tolerance -- [num]distance under which a point is seen as on a segment
+    candidate_lst[opt] -- [list] of the indices of the segments to examine with each segment, 
+                          returned by _find_extend_candidates(). If omitted, every other segment
+    max_radius[opt] -- [num]the farthest an end is extended. If omitted, any distance
     
     Returns:
-    True or False
+    A list of [start target, min dist start, end target, min dist end] of each segment.
+    A target is the index of a collinear segment, the (x, y, z) of an intersection or None.
     """
-    
-    vec = rs.VectorCreate(crv_start, crv_end)
-    vec2 = rs.VectorCreate(crv2_start, crv2_end)
-    return rs.IsVectorParallelTo(vec, vec2) != 0
-                
-
-# def drop_shadow(crv, depth=None, direction=None):
-    # """
-    # #Not implemented yet
-    
-    # Add shadow to section interior
-    
-    
-    # """
-    # if rs.IsCurve(crv):
-        # while depth == None or type(depth) != type(3):
-            # depth = input('depth of shadow(input a nubmer)')
-        # while direction != 1 or direction != 2:
-            # direction = input('direction of shadow(input 1 for inside, 2 for outside)')
+    x0, y0, z0, x1, y1, z1 = endpoints
+    count = len(x0)
+    inf = float('+inf')
+    max_dist = inf if max_radius is None else max_radius
+    cos_tolerance = math.cos(_PARALLEL_TOLERANCE)
+    sqrt = math.sqrt
+    
+    target_lst = []
+    
+    for i in range(count):
+        ax, ay, az = x0[i], y0[i], z0[i]
+        bx, by, bz = x1[i], y1[i], z1[i]
+        ux, uy, uz = bx - ax, by - ay, bz - az
+        uu = ux*ux + uy*uy + uz*uz
         
+        start_target, min_dist_start = None, inf
+        end_target, min_dist_end = None, inf
         
-        # shadow_outline = rs.CopyObject(crv, (depth*(-1), depth*(-1), 0))
-        
-        # rs.SelectObjects([crv, shadow_outline])
+        if candidate_lst is None:
+            j_lst = range(count)
+        else:
+            j_lst = candidate_lst[i]
+        
+        for j in j_lst:
+            if i == j:
+                continue
+            
+            cx, cy, cz = x0[j], y0[j], z0[j]
+            dx, dy, dz = x1[j], y1[j], z1[j]
+            vx, vy, vz = dx - cx, dy - cy, dz - cz
+            vv = vx*vx + vy*vy + vz*vz
+            uv = ux*vx + uy*vy + uz*vz
+            denom = uu*vv - uv*uv
+            
+            if uu and vv and abs(denom) > 1e-12*uu*vv:
+                # Closest point on the second line to the first line, as rs.LineLineIntersection()
+                wx, wy, wz = ax - cx, ay - cy, az - cz
+                t = (uu*(vx*wx + vy*wy + vz*wz) - uv*(ux*wx + uy*wy + uz*wz))/denom
+                px, py, pz = cx + vx*t, cy + vy*t, cz + vz*t
+                
+                dist_crv_int = 0
+                
+                # The point is on the second segment if it is within tolerance of the segment
+                t_min = min(1.0, max(0.0, t))
+                ox, oy, oz = px - cx - vx*t_min, py - cy - vy*t_min, pz - cz - vz*t_min
+                if sqrt(ox*ox + oy*oy + oz*oz) > tolerance:
+                    dist_crv_int += min(sqrt((px-cx)**2 + (py-cy)**2 + (pz-cz)**2), 
+                                        sqrt((px-dx)**2 + (py-dy)**2 + (pz-dz)**2))
+                
+                dist_start = sqrt((px-ax)**2 + (py-ay)**2 + (pz-az)**2)
+                dist_end = sqrt((px-bx)**2 + (py-by)**2 + (pz-bz)**2)
+                
+                if dist_start < dist_end:
+                    dist_crv_int += dist_start
+                    if dist_crv_int < min_dist_start and dist_crv_int <= max_dist:
+                        start_target, min_dist_start = (px, py, pz), dist_crv_int
+                else:
+                    dist_crv_int += dist_end
+                    if dist_crv_int < min_dist_end and dist_crv_int <= max_dist:
+                        end_target, min_dist_end = (px, py, pz), dist_crv_int
+            
+            else:
+                # Parallel lines are only extended to each other when the second one ends 
+                # on the first one's line, as verify_parallel(crv_start, crv_end, crv_start, crv2_end)
+                ex, ey, ez = ax - dx, ay - dy, az - dz
+                ee = ex*ex + ey*ey + ez*ez
+                if not uu or not ee or abs(ux*ex + uy*ey + uz*ez) < cos_tolerance*sqrt(uu*ee):
+                    continue
+                
+                dist_start = min(sqrt((ax-cx)**2 + (ay-cy)**2 + (az-cz)**2), sqrt(ee))
+                dist_end = min(sqrt((bx-cx)**2 + (by-cy)**2 + (bz-cz)**2), 
+                               sqrt((bx-dx)**2 + (by-dy)**2 + (bz-dz)**2))
+                
+                if dist_start < dist_end and dist_start < min_dist_start and dist_start <= max_dist:
+                    start_target, min_dist_start = j, dist_start
+                elif dist_end < dist_start and dist_end < min_dist_end and dist_end <= max_dist:
+                    end_target, min_dist_end = j, dist_end
+        
+        target_lst.append([start_target, min_dist_start, end_target, min_dist_end])
+    
+    return target_lst
+
+
+def _find_extend_targets_task(task):
+    """
+    Find the extension targets of one collection of segments on plain data, so that 
+    collections can be shared by workers, see _map_parallel().
+    
+    Arguments:
+    task -- [tuple](end point columns returned by _table_endpoints(), tolerance, max radius, nearest), 
+            see extend_to_closest()
+    
+    Returns:
+    The list of targets returned by _find_extend_targets()
+    """
+    endpoints, tolerance, max_radius, nearest = task
+    
+    # Small collections are examined whole, faster than searching a grid for them
+    if max_radius is None and (not nearest or len(endpoints[0]) <= 4*nearest):
+        return _find_extend_targets(endpoints, tolerance)
+    
+    candidate_lst, reach_lst, search = _find_extend_candidates(endpoints, max_radius, nearest)
+    target_lst = _find_extend_targets(endpoints, tolerance, candidate_lst, max_radius)
+    
+    # The distance to a target is never shorter than the distance from the end to the target segment. 
+    # An end whose target is not nearer than the segments left out examines the segments nearer than its target too
+    redo_lst = [[] for i in range(len(target_lst))]
+    for index, targets in enumerate(target_lst):
+        found = set()
+        for pt, dist, reach in ((search[3][index], targets[1], reach_lst[index][0]), 
+                                (search[4][index], targets[3], reach_lst[index][1])):
+            if dist >= reach:
+                found.update(_nearest_segments(search, pt, index, min(dist, max_radius or dist))[0])
+        if found - set(candidate_lst[index]):
+            redo_lst[index] = sorted(found.union(candidate_lst[index]))
+    
+    if [candidates for candidates in redo_lst if candidates]:
+        for index, targets in enumerate(_find_extend_targets(endpoints, tolerance, redo_lst, max_radius)):
+            if redo_lst[index]:
+                target_lst[index] = targets
+    
+    return target_lst
+
+
+def _extend_segments(table, target_lst, tolerance):
+    """
+    Extend the segments in memory to their targets, one after another, as _extend_crv_dict() 
+    does in the document: to a collinear segment as it is by then, or to a point.
+    
+    Arguments:
+    table -- the segment table returned by _make_segment_table(), modified in place
+    target_lst -- the targets of the segments returned by _find_extend_targets()
+    tolerance -- [num]distance under which a point is seen as on a segment
+    
+    Returns:
+    None
+    """
+    x0, y0, z0, x1, y1, z1 = _table_endpoints(table)
+    
+    for index, targets in enumerate(target_lst):
+        pts = list(_table_points(table, index))
+        for side, target, dist in ((0, targets[0], targets[1]), (1, targets[2], targets[3])):
+            if target is None or dist == 0:
+                continue
+            if type(target) == int:
+                _extend_segment_to_segment(pts, side, _table_points(table, target), tolerance)
+            elif _point_segment_distance(target, pts[0], pts[1]) > tolerance:
+                pts[side] = target
+        
+        x0[index], y0[index], z0[index] = pts[0][0], pts[0][1], pts[0][2]
+        x1[index], y1[index], z1[index] = pts[1][0], pts[1][1], pts[1][2]
+
+
+def _extend_segment_to_segment(pts, side, boundary, tolerance):
+    """
+    Extend one end of a segment along its line to a boundary segment, as rs.ExtendCurve() extends a line 
+    to a line: to where its line crosses the boundary beyond the end, or to the nearest end 
+    beyond it of a collinear boundary. The segment is not changed if it does not reach the boundary.
+    
+    Arguments:
+    pts -- [list] of the start and end (x, y, z) of the segment, modified in place
+    side -- [int]0 to extend the start, 1 to extend the end
+    boundary -- the start and end (x, y, z) of the boundary segment
+    tolerance -- [num]distance under which points are seen as on a line
+    
+    Returns:
+    None
+    """
+    tip, base = pts[side], pts[1 - side]
+    ux, uy, uz = tip[0] - base[0], tip[1] - base[1], tip[2] - base[2]
+    vx, vy, vz = boundary[1][0] - boundary[0][0], boundary[1][1] - boundary[0][1], boundary[1][2] - boundary[0][2]
+    wx, wy, wz = base[0] - boundary[0][0], base[1] - boundary[0][1], base[2] - boundary[0][2]
+    uu = ux*ux + uy*uy + uz*uz
+    uv = ux*vx + uy*vy + uz*vz
+    vv = vx*vx + vy*vy + vz*vz
+    uw = ux*wx + uy*wy + uz*wz
+    vw = vx*wx + vy*wy + vz*wz
+    denom = uu*vv - uv*uv
+    
+    best = None
+    if uu and vv and abs(denom) > 1e-12*uu*vv:
+        s = (uv*vw - vv*uw)/denom
+        t = (uu*vw - uv*uw)/denom
+        if s > 1 and -1e-9 <= t <= 1 + 1e-9:
+            best = (base[0] + ux*s, base[1] + uy*s, base[2] + uz*s)
+    
+    elif uu and _point_segment_distance(tip, boundary[0], boundary[1]) > tolerance:
+        # Collinear boundary: the nearest of its ends beyond the tip
+        best_along = None
+        for pt in boundary:
+            dx, dy, dz = pt[0] - tip[0], pt[1] - tip[1], pt[2] - tip[2]
+            cx, cy, cz = uy*dz - uz*dy, uz*dx - ux*dz, ux*dy - uy*dx
+            along = ux*dx + uy*dy + uz*dz
+            if (math.sqrt(cx*cx + cy*cy + cz*cz) <= tolerance*math.sqrt(uu) and along > 0 and 
+                (best_along is None or along < best_along)):
+                best, best_along = pt, along
+    
+    if best is not None:
+        pts[side] = best
+
+
+def _write_extend_segments(table, original, rejoin=False):
+    """
+    Write extended segments back to the document at once. Lines are extended in place. 
+    Other curves are replaced by their segments as lines, or by the lines joined if rejoin, 
+    with the attributes of the curves.
+    
+    Arguments:
+    table -- the segment table returned by _make_segment_table() and extended
+    original -- the rows of the table as read, see _table_rows()
+    rejoin[opt] -- [bool]join the segments of each curve that is not a line
+    
+    Returns:
+    A list of the curves in the document after the extension
+    """
+    offsets = table['offsets']
+    
+    new_crv_lst = []
+    replaced = []
+    for source, crv in enumerate(table['crv_ids']):
+        if offsets[source] == offsets[source+1]:
+            continue
+        
+        if table['is_line'][source]:
+            pts = _table_points(table, offsets[source])
+            original_pts = _table_points(original, offsets[source])
+            for side in (0, 1):
+                if pts[side] != original_pts[side]:
+                    rs.ExtendCurvePoint(crv, side, pts[side])
+            new_crv_lst.append(crv)
+        else:
+            lines = [rs.AddLine(*_table_points(table, index)) for index in range(offsets[source], offsets[source+1])]
+            lines = [line for line in lines if line]
+            if rejoin and lines:
+                lines = rs.JoinCurves(lines, delete_input=True)
+            if lines:
+                rs.MatchObjectAttributes(lines, crv)
+            new_crv_lst.extend(lines)
+            replaced.append(crv)
+    
+    if replaced:
+        rs.DeleteObjects(replaced)
+    
+    return new_crv_lst
+
+
+def extend_to_closest(crvs, batched=True, max_radius=EXTEND_MAX_RADIUS, nearest=EXTEND_NEAREST, rejoin=False):
+    """
+    Extend each curve in the specified collection to others that are closest to its ends respectively.
+    
+    Arguments:
+    crvs -- Guids of curves to be extended
+    batched[opt] -- [bool]find the targets and extend the curves on segments in memory, and write them
+                    to the document once at the end, see _make_segment_table(). True by default
+    max_radius[opt] -- [num]the farthest an end is extended, in batched mode. None for any distance
+    nearest[opt] -- [int]the number of curves nearest to each end examined, in batched mode. None for all the curves
+    rejoin[opt] -- [bool]join the segments of each curve that is not a line again, in batched mode
+    
+    Returns:
+    [str]The name of the new curves group
+    """
+    if crvs:
+        if batched:
+            tolerance = rs.UnitAbsoluteTolerance()
+            table = _make_segment_table(crvs, other_curves='polyline')
+            original = _table_rows(table, range(len(table['source'])))
+            target_lst = _find_extend_targets_task((_table_endpoints(table), tolerance, max_radius, nearest))
+            _extend_segments(table, target_lst, tolerance)
+            crv_lst = _write_extend_segments(table, original, rejoin)
+            non_crvs = table['skipped']
+        else:
+            crv_dist_lst, crv_lst, non_crvs = _init_crv_extend_lst(crvs)
+            crv_dist_lst = _make_crv_extend_lst(crv_dist_lst, crv_lst)
+            _extend_crv_dict(crv_dist_lst)
+        
+        crv_lst.extend(non_crvs)
+
+        new_group = rs.AddGroup()
+        rs.AddObjectsToGroup(crv_lst, new_group)
+
+        return new_group
+                        
+def _extend_crv_dict(crv_dist_lst):
+    """
+    Implement curve extension according to the list of curve extension dictionaries
+    
+    Arguments:
+    crv_dist_lst -- a list of curve extension mappings
+    
+    Returns:
+    None
+    """
+    for crv_dict in crv_dist_lst:
+        # iterate over every curve mapping in the list
+        # Examine curve start and end respectively
+        # Extend curve to curve or curve to point, depending on the target types
+        if crv_dict['start_target'] and crv_dict['min_dist_start'] != 0:
+            if type(crv_dict['start_target']) == type(crv_dict['crv_id']):
+                rs.ExtendCurve(crv_dict['crv_id'], 0, 0, [crv_dict['start_target']])
+            elif not rs.IsPointOnCurve(crv_dict['crv_id'], crv_dict['start_target']):
+                rs.ExtendCurvePoint(crv_dict['crv_id'], 0, crv_dict['start_target'])
+                
+        if crv_dict['end_target'] and crv_dict['min_dist_end'] != 0:
+            if type(crv_dict['end_target']) == type(crv_dict['crv_id']):
+                rs.ExtendCurve(crv_dict['crv_id'], 0, 1, [crv_dict['end_target']])
+            elif not rs.IsPointOnCurve(crv_dict['crv_id'], crv_dict['end_target']):
+                rs.ExtendCurvePoint(crv_dict['crv_id'], 1, crv_dict['end_target'])
+
+
+def extend_to_closest_group(objs, workers=1, rejoin=False):
+    """
+    Operate extend_to_closest() on each of the curve groups selected
+    
+    Arguments:
+    objs -- [Guid] of objects
+    workers[opt] -- [int]if more than 1, the targets of the groups are found by the workers at the same time 
+                    and the curves are extended after, see _map_parallel(). The groups should not share curves.
+    rejoin[opt] -- [bool]join the segments of each curve that is not a line again, see extend_to_closest()
+    
+    Returns:
+    None
+    """
+    groups = set() 
+    for obj in objs:
+        if rs.ObjectGroups(obj):
+            for group_name in rs.ObjectGroups(obj):
+                groups.add(group_name)
+    
+    if workers <= 1:
+        for group_name in groups:
+            crvs = rs.ObjectsByGroup(group_name)
+            extend_to_closest(crvs, rejoin=rejoin)
+        return
+    
+    # Read the segments of every group from the document
+    group_lst = []
+    task_lst = []
+    tolerance = rs.UnitAbsoluteTolerance()
+    for group_name in groups:
+        crvs = rs.ObjectsByGroup(group_name)
+        if crvs:
+            table = _make_segment_table(crvs, other_curves='polyline')
+            group_lst.append((table, _table_rows(table, range(len(table['source'])))))
+            task_lst.append((_table_endpoints(table), tolerance, EXTEND_MAX_RADIUS, EXTEND_NEAREST))
+    
+    # Find the targets of all the groups at once, then extend the curves one group after another
+    for (table, original), target_lst in zip(group_lst, _map_parallel(_find_extend_targets_task, task_lst, workers)):
+        _extend_segments(table, target_lst, tolerance)
+        crv_lst = _write_extend_segments(table, original, rejoin)
+        
+        new_group = rs.AddGroup()
+        rs.AddObjectsToGroup(crv_lst + table['skipped'], new_group)
+
+def verify_parallel(crv_start, crv_end, crv2_start, crv2_end):
+    """
+    Verify if two specified curves are parallel
+    
+    Arguments:
+    crv -- Guid of one curve to be examined
+    crv2 -- Guid of the other curve to be examined
+    
+    Returns:
+    True or False
+    """
+    
+    vec = rs.VectorCreate(crv_start, crv_end)
+    vec2 = rs.VectorCreate(crv2_start, crv2_end)
+    return rs.IsVectorParallelTo(vec, vec2) != 0
+                
+
+# def drop_shadow(crv, depth=None, direction=None):
+    # """
+    # #Not implemented yet
+    
+    # Add shadow to section interior
+    
+    
+    # """
+    # if rs.IsCurve(crv):
+        # while depth == None or type(depth) != type(3):
+            # depth = input('depth of shadow(input a nubmer)')
+        # while direction != 1 or direction != 2:
+            # direction = input('direction of shadow(input 1 for inside, 2 for outside)')
+        
+        
+        # shadow_outline = rs.CopyObject(crv, (depth*(-1), depth*(-1), 0))
+        
+        # rs.SelectObjects([crv, shadow_outline])
         
         
         # pass
@@ -793,7 +1743,7 @@ def set_print_frame(objs, frame_size=(11,8.5), scale=None, margin=0.5):
                 break
                 
         if not scale:
-            print "No scale between 1/4\" to 1/200\" can be found"
+            print("No scale between 1/4\" to 1/200\" can be found")
             return
         
     half_frame_x_len = scale*frame_size[0]/2.0
@@ -991,30 +1941,52 @@ def assign_standard_print(drawing_layer=DRAWING_NAME):
                     rs.LayerPrintWidth(layer_name, -1)
 
 
-def _make_block_replace_dict():
+def _make_block_replace_dict(tolerance=0.001):
     """
     Creates a mapping where each block definition in the document as replacement is mapped to a set 
-    of the block definitions that are seen as similar to their replacement
+    of the block definitions that are seen as similar to their replacement.
+    
+    Replacement block definitions are kept in buckets by a fingerprint of their bounding boxes 
+    (see _bbox_fingerprint()), so each block definition is only compared with the replacements 
+    in the neighbouring buckets instead of all of them.
     
     Arguments:
-    None
+    tolerance[opt] -- [num]distance tolerance passed to _has_sim_anchor()
     
     Returns:
     The mapping where each block definition in the document as replacement is mapped to a set 
     of the block definitions that are seen as similar to their replacement
     """
     block_replace_dict = {}
-    anchor_dict = _make_anchor_dict()
+    bbox_dict = _make_block_bbox_dict()
+    anchor_dict = _make_anchor_dict(bbox_dict)
+    anchor_index_dict = {}
+    
+    # Bounding boxes similar enough for _has_sim_anchor() differ by less than a step
+    # in each coordinate, so they are in the same or neighbouring buckets
+    step = tolerance*10
+    bucket_dict = {}
+    exist_order = {}
     
     for block_name in rs.BlockNames():
         flag = False
+        fingerprint = _bbox_fingerprint(bbox_dict[block_name], step)
         
-        # Iterate over the existing replacement block definitions in the mapping
-        for exist_block, anchor in block_replace_dict.items():
+        # Find the existing replacement block definitions in the neighbouring buckets,
+        # in the order they were added to the mapping
+        candidates = []
+        if fingerprint:
+            for key in _neighbour_fingerprints(fingerprint):
+                candidates.extend(bucket_dict.get(key, []))
+        candidates.sort(key=lambda exist_block: exist_order[exist_block])
+        
+        # Iterate over the existing replacement block definitions in the buckets
+        for exist_block in candidates:
             
             # If the block geometries are similar to an existing replacement block,
             # add it to the replacement block's value set
-            if _has_sim_anchor(block_name, exist_block, anchor_dict):
+            if _has_sim_anchor(block_name, exist_block, anchor_dict, tolerance, bbox_dict=bbox_dict, 
+                               anchor_index_dict=anchor_index_dict):
                 flag = True
                 block_replace_dict[exist_block].add(block_name)
                 # Skip comparison with the rest of the existing replacement block definitions
@@ -1024,11 +1996,59 @@ def _make_block_replace_dict():
         # no similar blocks are found in the replacement mapping
         if not flag:
             block_replace_dict.update({block_name:set([])})
+            exist_order[block_name] = len(exist_order)
+            if fingerprint:
+                bucket_dict.setdefault(fingerprint, []).append(block_name)
     
     return block_replace_dict
 
 
-def replace_same_block(block_replace_dict):
+def _make_block_bbox_dict():
+    """
+    Create a mapping of each block definition in the document to the bounding box of its objects.
+    
+    Arguments:
+    None
+    
+    Returns:
+    A dictionary of each block name[string] to its bounding box as rs.BoundingBox() returns, 
+    None if the block definition is empty
+    """
+    bbox_dict = {}
+    
+    for block_name in rs.BlockNames():
+        block_objs = rs.BlockObjects(block_name)
+        bbox_dict[block_name] = rs.BoundingBox(block_objs) if block_objs else None
+    
+    return bbox_dict
+
+
+def _bbox_fingerprint(bbox, step):
+    """
+    Quantize the minimum and maximum corners of a bounding box in plan to a grid of the given step.
+    
+    Returns:
+    A tuple of four integers, None if there is no bounding box
+    """
+    if not bbox:
+        return None
+    
+    return (int(math.floor(bbox[0][0]/step)), int(math.floor(bbox[0][1]/step)), 
+            int(math.floor(bbox[6][0]/step)), int(math.floor(bbox[6][1]/step)))
+
+
+def _neighbour_fingerprints(fingerprint):
+    """
+    Returns the fingerprint and all the fingerprints that differ from it by at most one step in each value.
+    """
+    keys = [()]
+    for value in fingerprint:
+        keys = [key + (value + offset,) for key in keys for offset in (-1, 0, 1)]
+    
+    return keys
+
+
+def replace_same_block(block_replace_dict, commit=False):
     """
     Provide a potential replacement of the block instances that are geometrically similar as provided in the 
     given mapping where each block definition as replacement is mapped to a collection 
@@ -1039,6 +2059,8 @@ def replace_same_block(block_replace_dict):
     Arguments:
     block_replace_dict -- [dict]mapping where each block definition as replacement is mapped to a collection 
                                 of the block definitions that are seen as similar to their replacement
+    commit[opt] -- [bool]if True, the replaced block instances are deleted and the block definitions 
+                   no longer used are purged
     
     Returns:
     Uids of the replacements
@@ -1047,21 +2069,33 @@ def replace_same_block(block_replace_dict):
     new_group = rs.AddGroup('New')
     old_group = rs.AddGroup('Old')
     
-    # Iterate over each name of the block definitions that are replacements
+    # Find the instances of every block definition in one pass
+    instance_dict = {}
+    for block_inst in rs.ObjectsByType(4096):
+        instance_dict.setdefault(rs.BlockInstanceName(block_inst), []).append(block_inst)
+    
+    # Collect each replacement with the Xform of the instance it replaces
+    insert_lst = []
+    old_instances = []
     for standard_block, same_blocks in block_replace_dict.items():
-        # Iterate over each name of the block definitions that are to be replaced
         for block_replace in same_blocks:
-            # Iterate over each instances of the block to be replaced
-            for block_inst in rs.BlockInstances(block_replace):
-                # Find the Xform of the instance
-                arr_matrix = rs.BlockInstanceXform(block_inst)
-                
-                # Insert an instance of the replacement and transform it
-                replacement = rs.InsertBlock(standard_block, (0,0,0))
-                rs.TransformObject(replacement, arr_matrix)
-                
-                rs.AddObjectToGroup(replacement, new_group)
-                rs.AddObjectToGroup(block_inst, old_group)
+            for block_inst in instance_dict.get(block_replace, []):
+                insert_lst.append((standard_block, rs.BlockInstanceXform(block_inst)))
+                old_instances.append(block_inst)
+    
+    # Insert the replacements transformed already
+    replacements = [rs.InsertBlock2(standard_block, arr_matrix) for standard_block, arr_matrix in insert_lst]
+    
+    rs.AddObjectsToGroup(replacements, new_group)
+    
+    if commit:
+        rs.DeleteObjects(old_instances)
+        for same_blocks in block_replace_dict.values():
+            for block_replace in same_blocks:
+                if rs.IsBlock(block_replace) and not rs.BlockInstanceCount(block_replace, 1):
+                    rs.DeleteBlock(block_replace)
+    else:
+        rs.AddObjectsToGroup(old_instances, old_group)
     
     return rs.ObjectsByGroup(new_group, True) 
     
@@ -1127,93 +2161,382 @@ def _find_block_anchors(block_name, division=20):
     return intersection  
 
     
-def _make_anchor_dict():
+def _find_block_anchors_analytic(block_name, division=20, bbox=None, samples=64, vertex_lsts=None):
     """
-    Create a mapping of each block definition in the document to its
-    anchor points.
+    Finds the same anchors as _find_block_anchors() without adding grid lines to the document.
+    The grid lines are axis aligned, so they are intersected with the segments of 
+    the block's curves in closed form. Curves that are not lines or polylines are 
+    sampled into segments once.
     
     Arguments:
-    None
+    block_name -- [str]name of the block to query
+    division[opt] -- the number of grid divisions in x and y direction
+    bbox[opt] -- the bounding box of the block's objects. If omitted, it will be calculated
+    samples[opt] -- [int]the number of segments a curve that is not a line or polyline is sampled into
+    vertex_lsts[opt] -- [list]the vertices of the block's curves, as _block_vertex_lsts() returns.
+                        If omitted, they will be read from the block
     
     Returns:
-    A dictionary of each block name[string] to its anchor points[set]
+    A set of the intersections[(x, y, z)]
     """
+    intersection = set([])
     
-    anchor_dict = {}
+    if bbox is None:
+        block_objs = rs.BlockObjects(block_name)
+        if block_objs:
+            bbox = rs.BoundingBox(block_objs)
+    if not bbox:
+        return intersection
     
-    for block_name in rs.BlockNames():
-        anchors = _find_block_anchors(block_name)
-        anchor_dict.update({block_name:anchors})
+    pt_0 = bbox[0]
+    pt_1 = bbox[1]
+    pt_2 = bbox[2]
     
-    return anchor_dict
+    # The distance between grid lines in x and y directions with the given divisions
+    step_x = (pt_1[0] - pt_0[0])/float(division)
+    step_y = (pt_2[1] - pt_1[1])/float(division)
+    
+    # No need to evaluate the blocks that are in 1d as they cannot be too complicated.
+    if step_x and step_y:
+        tolerance = rs.UnitAbsoluteTolerance()
         
-def _has_sim_anchor(block_1, block_2, anchor_dict, tolerance=0.001, percentage=.95):
+        if vertex_lsts is None:
+            vertex_lsts = _block_vertex_lsts(block_name, samples)
+        
+        for pts in vertex_lsts:
+            # Vertical grid lines from the right, horizontal grid lines from the bottom, as _find_block_anchors()
+            intersection.update(_grid_anchors(pts, (pt_1[0], -step_x), (pt_0[1], step_y), pt_0[2], division, tolerance))
+    
+    return intersection
+
+
+def _block_vertex_lsts(block_name, samples=64):
     """
-    Check if the first given block definition has similar anchor points to those of the 
-    second block definition within the given tolerance
+    Returns a list of the vertices[(x, y, z)] of each curve in a block definition: the vertices of lines 
+    and polylines, or the points dividing another curve into the given number of segments.
+    """
+    return _table_vertex_lsts(_make_segment_table(rs.BlockObjects(block_name), other_curves='divide', samples=samples))
+
+
+def _grid_anchors(pts, grid_x, grid_y, z, division, tolerance):
+    """
+    Intersect the segments of a polyline with an axis aligned grid in closed form.
+    Where a segment lies on a grid line, the grid line and the polyline overlap and 
+    the points there are not intersections, as rs.CurveCurveIntersection() reports.
     
     Arguments:
-    block_1 -- [str]name of the first block definition
-    block_2 -- [str]name of the second block definition
-    anchor_dict -- [dict]a mapping that maps each block name to their anchor points in the document
-    tolerance[opt] -- [num]distance tolerance under which the anchor points can be seen as in the same location
+    pts -- a list of the polyline's vertices
+    grid_x -- (x of the first vertical grid line, distance to the next one)
+    grid_y -- (y of the first horizontal grid line, distance to the next one)
+    z -- [num]the elevation of the grid
+    division -- [int]the number of grid divisions, there are division+1 lines in each direction
+    tolerance -- [num]distance tolerance of an intersection
     
     Returns:
-    True or False
+    A set of the intersections[(x, y, z)]
     """
-    bbox_1 = rs.BoundingBox(rs.BlockObjects(block_1))
-    bbox_2 = rs.BoundingBox(rs.BlockObjects(block_2))
+    found = []
+    overlaps = []
     
-    # Compare the two blocks' bounding box as a fast way to decide
-    # whether they are similar
-    for i in range(len(bbox_1)):
-        if rs.Distance(bbox_1[i], bbox_2[i]) >= tolerance*10:
-            return False
+    for k in range(len(pts)-1):
+        p = (pts[k][0], pts[k][1], pts[k][2])
+        q = (pts[k+1][0], pts[k+1][1], pts[k+1][2])
+        
+        # axis 0 for the vertical grid lines crossing x, axis 1 for the horizontal grid lines crossing y
+        for axis, (first, step) in ((0, grid_x), (1, grid_y)):
+            other = 1 - axis
+            low = min(p[axis], q[axis]) - tolerance
+            high = max(p[axis], q[axis]) + tolerance
+            
+            i_range = sorted([(low - first)/step, (high - first)/step])
+            for i in range(max(0, int(math.ceil(i_range[0]))), min(division, int(math.floor(i_range[1]))) + 1):
+                line_at = first + step*i
+                
+                if abs(p[axis] - line_at) <= tolerance and abs(q[axis] - line_at) <= tolerance:
+                    overlaps.append((axis, i, min(p[other], q[other]) - tolerance, max(p[other], q[other]) + tolerance))
+                    continue
+                
+                length = q[axis] - p[axis]
+                t = (line_at - p[axis])/length if length else 0.0
+                
+                # Snap to the vertices within tolerance so that a vertex on a grid line is found once
+                if t <= 0 or abs(p[axis] - line_at) <= tolerance:
+                    pt = p
+                elif t >= 1 or abs(q[axis] - line_at) <= tolerance:
+                    pt = q
+                else:
+                    pt = (p[0] + (q[0]-p[0])*t, p[1] + (q[1]-p[1])*t, p[2] + (q[2]-p[2])*t)
+                
+                if abs(pt[axis] - line_at) <= tolerance and abs(pt[2] - z) <= tolerance:
+                    found.append((axis, i, pt))
     
-    # Count how many anchor points of block_1 are within the distance tolerance
-    # to a curve in block_2
-    anchor_1_in_2 = 0
-    for pt in anchor_dict[block_1]:
-        for pt2 in anchor_dict[block_2]:
-            if rs.Distance(pt, pt2) <= tolerance:
-                anchor_1_in_2 += 1
+    intersection = set([])
+    for axis, i, pt in found:
+        for o_axis, o_i, low, high in overlaps:
+            if o_axis == axis and o_i == i and low <= pt[1 - axis] <= high:
+                break
+        else:
+            intersection.add(pt)
     
-    # If there are more than percentage x total count of anchor points in block_1 
-    # within the distance tolerance to a curve in the block_2, block_1 is considered
-    # to be similar to block_2
-    return anchor_1_in_2 > len(anchor_dict[block_1]) * percentage
+    return intersection
 
 
-def print_keyword_in_name():
+def _make_anchor_dict(bbox_dict=None, cache_file=ANCHOR_CACHE_FILE, cache_size=ANCHOR_CACHE_SIZE):
     """
-    Print the keywords in the name of the selected block instnace's definition.
+    Create a mapping of each block definition in the document to its
+    anchor points, found by _find_block_anchors_analytic().
+    Anchor points of definitions whose geometry is in the cache file are not found again.
     
     Arguments:
-    None. The given block instance can be preselected.
+    bbox_dict[opt] -- [dict]a mapping of each block name to its bounding box, as _make_block_bbox_dict() returns.
+                      If omitted, the bounding boxes are calculated
+    cache_file[opt] -- [str]path of the anchor cache file. If None, the anchors are always found
+    cache_size[opt] -- [int]the maximum number of definitions kept in the cache file
     
     Returns:
-    None
+    A dictionary of each block name[string] to its anchor points[set]
     """
-    block_instance = rs.GetObject(message="Pick a block instance", preselect=True)
+    
+    anchor_dict = {}
+    
+    if cache_file:
+        cache = _load_anchor_cache(cache_file)
+    
+    for block_name in rs.BlockNames():
+        if bbox_dict:
+            bbox = bbox_dict[block_name]
+        else:
+            block_objs = rs.BlockObjects(block_name)
+            bbox = rs.BoundingBox(block_objs) if block_objs else None
+        
+        if not cache_file or not bbox:
+            anchors = _find_block_anchors_analytic(block_name, bbox=bbox)
+            anchor_dict.update({block_name:anchors})
+            continue
+        
+        vertex_lsts = _block_vertex_lsts(block_name)
+        key = _anchor_cache_key(vertex_lsts, bbox)
+        
+        cache['clock'] += 1
+        entry = cache['entries'].get(key)
+        if entry is None:
+            anchors = _find_block_anchors_analytic(block_name, bbox=bbox, vertex_lsts=vertex_lsts)
+            entry = {'anchors':sorted(anchors), 'bbox':[(pt[0], pt[1], pt[2]) for pt in bbox]}
+            cache['entries'][key] = entry
+        else:
+            anchors = set([tuple(pt) for pt in entry['anchors']])
+        entry['used'] = cache['clock']
+        cache['changed'] = True
+        
+        anchor_dict.update({block_name:anchors})
+    
+    if cache_file:
+        _save_anchor_cache(cache, cache_file, cache_size)
+    
+    return anchor_dict
+
+
+_ANCHOR_CACHE_VERSION = 1
+"""
+Version of the anchor cache file and of the way anchors are found. 
+Increase it when _find_block_anchors_analytic() changes so that old files are not used.
+"""
+
+
+def _anchor_cache_key(vertex_lsts, bbox, division=20):
+    """
+    Returns a hash[str] of a block definition's curve vertices, bounding box and grid division.
+    Coordinates are rounded so that the same geometry exported again has the same hash.
+    """
+    md5 = hashlib.md5()
+    md5.update(('%d;%d;' % (_ANCHOR_CACHE_VERSION, division)).encode('ascii'))
+    for pt in bbox:
+        md5.update(('%.6f,%.6f,%.6f;' % (pt[0], pt[1], pt[2])).encode('ascii'))
+    for pts in vertex_lsts:
+        md5.update(('|' + ';'.join(['%.6f,%.6f,%.6f' % (pt[0], pt[1], pt[2]) for pt in pts])).encode('ascii'))
+    
+    return md5.hexdigest()
+
+
+def _load_anchor_cache(cache_file):
+    """
+    Read the anchor cache file. A missing, unreadable or outdated file gives an empty cache.
+    
+    Returns:
+    A dictionary {'entries':{hash:{'anchors', 'bbox', 'used'}}, 'clock':[int], 'changed':[bool]}
+    """
+    cache = {'entries':{}, 'clock':0, 'changed':False}
+    
+    if not os.path.isfile(cache_file):
+        return cache
+    
+    try:
+        with open(cache_file, 'r') as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        print("Anchor cache file %s cannot be read and will be replaced" % cache_file)
+        return cache
+    
+    if data.get('version') == _ANCHOR_CACHE_VERSION:
+        cache['entries'] = data.get('entries', {})
+        cache['clock'] = data.get('clock', 0)
+    
+    return cache
+
+
+def _save_anchor_cache(cache, cache_file, cache_size=ANCHOR_CACHE_SIZE):
+    """
+    Write the anchor cache file, dropping the least recently used definitions above cache_size.
+    The file is not written if no definition was looked up.
+    """
+    if not cache['changed']:
+        return
+    
+    entries = cache['entries']
+    if len(entries) > cache_size:
+        by_use = sorted(entries, key=lambda key: entries[key].get('used', 0))
+        for key in by_use[:len(entries) - cache_size]:
+            del entries[key]
+    
+    # Write to a temporary file first so that an interrupted run does not leave a broken cache
+    temp_file = cache_file + '.tmp'
+    try:
+        with open(temp_file, 'w') as f:
+            json.dump({'version':_ANCHOR_CACHE_VERSION, 'clock':cache['clock'], 'entries':entries}, f)
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+        os.rename(temp_file, cache_file)
+    except (IOError, OSError):
+        print("Anchor cache file %s cannot be written" % cache_file)
+        
+def _has_sim_anchor(block_1, block_2, anchor_dict, tolerance=0.001, percentage=.95, bbox_dict=None, anchor_index_dict=None):
+    """
+    Check if the first given block definition has similar anchor points to those of the 
+    second block definition within the given tolerance
+    
+    Arguments:
+    block_1 -- [str]name of the first block definition
+    block_2 -- [str]name of the second block definition
+    anchor_dict -- [dict]a mapping that maps each block name to their anchor points in the document
+    tolerance[opt] -- [num]distance tolerance under which the anchor points can be seen as in the same location
+    bbox_dict[opt] -- [dict]a mapping that maps each block name to its bounding box, as _make_block_bbox_dict() returns.
+                      If omitted, the bounding boxes are calculated
+    anchor_index_dict[opt] -- [dict]a mapping of block names to their anchor indices made by _make_anchor_index() 
+                              with the same tolerance. The index of block_2 is added if missing, so the same 
+                              mapping can be passed to later calls
+    
+    Returns:
+    True or False
+    """
+    if bbox_dict:
+        bbox_1 = bbox_dict[block_1]
+        bbox_2 = bbox_dict[block_2]
+    else:
+        bbox_1 = rs.BoundingBox(rs.BlockObjects(block_1))
+        bbox_2 = rs.BoundingBox(rs.BlockObjects(block_2))
+    
+    if not bbox_1 or not bbox_2:
+        return False
+    
+    # Compare the two blocks' bounding box as a fast way to decide
+    # whether they are similar
+    for i in range(len(bbox_1)):
+        if rs.Distance(bbox_1[i], bbox_2[i]) >= tolerance*10:
+            return False
+    
+    if anchor_index_dict is None:
+        anchor_index_dict = {}
+    if block_2 not in anchor_index_dict:
+        anchor_index_dict[block_2] = _make_anchor_index(anchor_dict[block_2], tolerance)
+    anchor_index = anchor_index_dict[block_2]
+    
+    # Count how many anchor points of block_1 are within the distance tolerance
+    # to an anchor point of block_2. Each anchor point of block_1 is counted once.
+    anchor_1_in_2 = 0
+    for pt in anchor_dict[block_1]:
+        if _has_anchor_near(anchor_index, pt, tolerance):
+            anchor_1_in_2 += 1
+    
+    # If there are more than percentage x total count of anchor points in block_1 
+    # within the distance tolerance to a curve in the block_2, block_1 is considered
+    # to be similar to block_2
+    return anchor_1_in_2 > len(anchor_dict[block_1]) * percentage
+
+
+def _make_anchor_index(anchors, tolerance):
+    """
+    Put anchor points into a hashed grid with cells of the size of tolerance, so 
+    the anchor points within tolerance of a point are in the 27 cells around it.
+    
+    Arguments:
+    anchors -- [set]anchor points[(x, y, z)]
+    tolerance -- [num]distance tolerance of the queries
+    
+    Returns:
+    A dictionary of each cell[(i, j, k)] to a list of the anchor points in it
+    """
+    anchor_index = {}
+    for pt in anchors:
+        cell = (int(math.floor(pt[0]/tolerance)), int(math.floor(pt[1]/tolerance)), int(math.floor(pt[2]/tolerance)))
+        anchor_index.setdefault(cell, []).append((pt[0], pt[1], pt[2]))
+    
+    return anchor_index
+
+
+def _has_anchor_near(anchor_index, pt, tolerance):
+    """
+    Check if an anchor point in anchor_index made by _make_anchor_index() is within tolerance of pt.
+    """
+    i = int(math.floor(pt[0]/tolerance))
+    j = int(math.floor(pt[1]/tolerance))
+    k = int(math.floor(pt[2]/tolerance))
+    tolerance_sq = tolerance*tolerance
+    
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            for dk in (-1, 0, 1):
+                for pt2 in anchor_index.get((i+di, j+dj, k+dk), ()):
+                    dx = pt[0] - pt2[0]
+                    dy = pt[1] - pt2[1]
+                    dz = pt[2] - pt2[2]
+                    if dx*dx + dy*dy + dz*dz <= tolerance_sq:
+                        return True
+    
+    return False
+
+
+def print_keyword_in_name():
+    """
+    Print the keywords in the name of the selected block instnace's definition.
+    
+    Arguments:
+    None. The given block instance can be preselected.
+    
+    Returns:
+    None
+    """
+    block_instance = rs.GetObject(message="Pick a block instance", preselect=True)
     keyword_lst = _keyword_in_block_name(block_instance)
     if keyword_lst == -1:
-        print "Not a block instance"
+        print("Not a block instance")
     
     elif not keyword_lst:
-        print "No keywords found"
+        print("No keywords found")
     
     else:
         keyword_str = ''
-        for keyword in keyword_lst:
+        for keyword in sorted(keyword_lst):
             keyword_str = keyword_str + ', ' + keyword
-        print 'Keywords(s): ' + keyword_str[2:]
+        print('Keywords(s): ' + keyword_str[2:])
 
-def _keyword_in_block_name(block_instance):
+def _keyword_in_block_name(block_instance, matcher=None):
     """
     Given a block instances, returns an array of the keywords in its definition's name.
+    Not case sensitive, as find_blocks().
     
     Argument:
     block_instances -- object_id of a block instance
+    matcher[opt] -- a matcher of BLOCKS_KEYWORD made by _make_keyword_matcher(). If omitted, it is made
     
     Returns:
     An array of keywords
@@ -1223,15 +2546,76 @@ def _keyword_in_block_name(block_instance):
     if rs.IsBlockInstance(block_instance):
         block_name = rs.BlockInstanceName(block_instance)
         
-        keyword_lst = []
+        if matcher is None:
+            matcher = _make_keyword_matcher([(keyword, keyword) for keyword in BLOCKS_KEYWORD])
         
-        for keyword in BLOCKS_KEYWORD:
-            if keyword in block_name:
-                keyword_lst.append(keyword)
+        keyword_lst = list(_match_keywords(matcher, block_name))
         
         return keyword_lst 
     
     return -1
+
+
+def _make_keyword_matcher(keyword_pairs):
+    """
+    Build an Aho-Corasick automaton to find all the keywords in a name in one pass over the name.
+    Not case sensitive.
+    
+    Arguments:
+    keyword_pairs -- [list]pairs of (keyword[str], value). A value is reported when its keyword is found.
+                     Several keywords can have the same value and a keyword can have several values
+    
+    Returns:
+    A matcher for _match_keywords(), a tuple of the lists of the states' 
+    transitions[dict], fail states[int] and values[set]
+    """
+    goto = [{}]
+    output = [set([])]
+    
+    # A trie of the keywords
+    for keyword, value in keyword_pairs:
+        state = 0
+        for char in keyword.upper():
+            if char not in goto[state]:
+                goto.append({})
+                output.append(set([]))
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        output[state].add(value)
+    
+    # The fail state of each state is the longest suffix of its prefix in the trie, found breadth first
+    fail = [0]*len(goto)
+    queue = list(goto[0].values())
+    for state in queue:
+        for char, next_state in goto[state].items():
+            queue.append(next_state)
+            
+            fail_state = fail[state]
+            while fail_state and char not in goto[fail_state]:
+                fail_state = fail[fail_state]
+            fail[next_state] = goto[fail_state].get(char, 0)
+            
+            output[next_state] = output[next_state] | output[fail[next_state]]
+    
+    return goto, fail, output
+
+
+def _match_keywords(matcher, name):
+    """
+    Returns a set of the values of all keywords in the name, with a matcher made by _make_keyword_matcher().
+    """
+    goto, fail, output = matcher
+    
+    found = set(output[0])
+    state = 0
+    for char in name.upper():
+        while state and char not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(char, 0)
+        if output[state]:
+            found.update(output[state])
+    
+    return found
     
     
     
@@ -1252,6 +2636,217 @@ def sort_by_print_width(crvs):
     
     return sorted_lst
 
+
+_SEGMENT_COLUMNS = ('x0', 'y0', 'z0', 'x1', 'y1', 'z1')
+
+
+def _make_segment_table(crvs, other_curves=None, samples=64, layers=False):
+    """
+    Read the straight segments of curves once into a table of columns, shared by the overlap search,
+    the curve extension and the block anchors. Lines are one segment each and polylines are cut at their 
+    vertices. Other curves are converted to polylines as rs.ConvertCurveToPolyline() does if other_curves 
+    is 'polyline', divided into samples segments if it is 'divide', or skipped.
+    
+    The segments of a curve are the rows from table['offsets'][source] up to table['offsets'][source+1], 
+    where source is the index of the curve in table['crv_ids'].
+    
+    Arguments:
+    crvs -- [Guid] of objects. Objects that are not curves are skipped
+    other_curves[opt] -- [str]'polyline', 'divide' or None, how curves that are neither lines nor polylines are read
+    samples[opt] -- [int]the number of segments of a divided curve
+    layers[opt] -- [bool]also read the layer and the print width of each curve
+    
+    Returns:
+    A dictionary of the columns of the segments: 'x0', 'y0', 'z0', 'x1', 'y1', 'z1'[array('d')], the coordinates
+    of the start and end points, and 'source'[array('i')], the curve of each segment;
+    of the curves read: 'crv_ids', 'is_line', 'offsets'[array('i')], and if layers, 'layer'[array('i')], 
+    the index of its layer in 'layer_names', and 'print_width'[array('d')];
+    and 'skipped', a list of the objects not read
+    """
+    table = _new_segment_table()
+    table.update({'crv_ids':[], 'is_line':[], 'offsets':array('i', [0]), 'skipped':[]})
+    if layers:
+        table.update({'layer':array('i'), 'print_width':array('d'), 'layer_names':[]})
+        layer_index = {}
+    
+    for crv in crvs:
+        pts = None
+        is_line = False
+        if rs.IsCurve(crv):
+            if rs.IsLine(crv):
+                pts = [rs.CurveStartPoint(crv), rs.CurveEndPoint(crv)]
+                is_line = True
+            elif rs.IsPolyline(crv):
+                pts = rs.PolylineVertices(crv)
+            elif other_curves == 'polyline':
+                polyline = rs.coercecurve(crv).ToPolyline(0, 0, math.radians(5.0), 0.0, 0, 0.01, 0.0, 0.0, True)
+                pts = [polyline.Point(i) for i in range(polyline.PointCount)]
+            elif other_curves == 'divide':
+                pts = rs.DivideCurve(crv, samples, False, True) or []
+        
+        if pts is None:
+            table['skipped'].append(crv)
+            continue
+        
+        source = len(table['crv_ids'])
+        for i in range(len(pts) - 1):
+            _table_append(table, pts[i], pts[i+1], source)
+        
+        table['crv_ids'].append(crv)
+        table['is_line'].append(is_line)
+        table['offsets'].append(len(table['source']))
+        
+        if layers:
+            # Each layer's print width is only queried once
+            layer_name = rs.ObjectLayer(crv)
+            if layer_name not in layer_index:
+                layer_index[layer_name] = len(table['layer_names'])
+                table['layer_names'].append(layer_name)
+                table['print_width'].append(rs.LayerPrintWidth(layer_name))
+            table['layer'].append(layer_index[layer_name])
+    
+    if layers:
+        # From the print width of each layer to the print width of each curve
+        layer_widths = table['print_width']
+        table['print_width'] = array('d', [layer_widths[index] for index in table['layer']])
+    
+    return table
+
+
+def _new_segment_table():
+    """
+    Returns a segment table without rows, holding the columns of the segments only.
+    """
+    table = dict([(name, array('d')) for name in _SEGMENT_COLUMNS])
+    table['source'] = array('i')
+    return table
+
+
+def _table_append(table, start, end, source):
+    """
+    Add a segment from start to end of the given source to a segment table.
+    """
+    for i in range(3):
+        table[_SEGMENT_COLUMNS[i]].append(start[i])
+        table[_SEGMENT_COLUMNS[i+3]].append(end[i])
+    table['source'].append(source)
+
+
+def _table_points(table, index):
+    """
+    Returns the start and end (x, y, z) of a segment in a segment table.
+    """
+    return ((table['x0'][index], table['y0'][index], table['z0'][index]), 
+            (table['x1'][index], table['y1'][index], table['z1'][index]))
+
+
+def _table_endpoints(table):
+    """
+    Returns the columns x, y and z of the start points and x, y and z of the end points of a segment table.
+    """
+    return tuple([table[name] for name in _SEGMENT_COLUMNS])
+
+
+def _table_rows(table, indices):
+    """
+    Returns a segment table of the given rows of another, in that order, with the columns of the segments only. 
+    It holds plain values and can be handed to the workers of _map_parallel().
+    """
+    rows = _new_segment_table()
+    for name in _SEGMENT_COLUMNS + ('source',):
+        column = table[name]
+        rows[name].extend([column[index] for index in indices])
+    
+    return rows
+
+
+def _table_vertex_lsts(table):
+    """
+    Returns a list of the vertices[(x, y, z)] of each curve read into a segment table.
+    """
+    x0, y0, z0, x1, y1, z1 = _table_endpoints(table)
+    offsets = table['offsets']
+    
+    vertex_lsts = []
+    for source in range(len(table['crv_ids'])):
+        first, last = offsets[source], offsets[source+1]
+        pts = [(x0[i], y0[i], z0[i]) for i in range(first, last)]
+        if last > first:
+            pts.append((x1[last-1], y1[last-1], z1[last-1]))
+        vertex_lsts.append(pts)
+    
+    return vertex_lsts
+
+
+def _segment_bbox(start, end, padding=0):
+    """
+    Returns the 2d bounding box (min x, min y, max x, max y) of a segment, padded on all sides.
+    """
+    return (min(start[0], end[0]) - padding, min(start[1], end[1]) - padding, 
+            max(start[0], end[0]) + padding, max(start[1], end[1]) + padding)
+
+
+def _make_segment_grid(bboxes, cell_size):
+    """
+    Build a uniform grid index over 2d bounding boxes so that boxes near a location can be found
+    without examining all the others.
+    
+    Arguments:
+    bboxes -- [list] of (min x, min y, max x, max y)
+    cell_size -- [num]width and height of a grid cell
+    
+    Returns:
+    A dictionary of each grid cell[(int, int)] to a list of the indices of the boxes touching the cell
+    """
+    grid = {}
+    
+    for index, bbox in enumerate(bboxes):
+        for i in range(int(bbox[0]//cell_size), int(bbox[2]//cell_size) + 1):
+            for j in range(int(bbox[1]//cell_size), int(bbox[3]//cell_size) + 1):
+                if (i, j) in grid:
+                    grid[(i, j)].append(index)
+                else:
+                    grid[(i, j)] = [index]
+    
+    return grid
+
+
+def _grid_query(grid, cell_size, bbox):
+    """
+    Find the boxes in a grid index whose cells are touched by the given 2d bounding box.
+    
+    Arguments:
+    grid -- [dict]grid index returned by _make_segment_grid()
+    cell_size -- [num]the cell size the grid was built with
+    bbox -- [tuple](min x, min y, max x, max y) to query
+    
+    Returns:
+    A set of the indices of the boxes that may touch bbox
+    """
+    found = set()
+    
+    for i in range(int(bbox[0]//cell_size), int(bbox[2]//cell_size) + 1):
+        for j in range(int(bbox[1]//cell_size), int(bbox[3]//cell_size) + 1):
+            if (i, j) in grid:
+                found.update(grid[(i, j)])
+    
+    return found
+
+
+def _grid_cell_size(bboxes, minimum):
+    """
+    Pick a grid cell size close to the average extent of the given boxes, so that a box
+    usually touches no more than a few cells.
+    """
+    if not bboxes:
+        return minimum
+    
+    total = 0.0
+    for bbox in bboxes:
+        total += max(bbox[2] - bbox[0], bbox[3] - bbox[1])
+    
+    return max(total/len(bboxes), minimum)
+
 def potential_overlap_lines(a_crv, overlap_threshold=0.5):
     bd_box = rs.BoundingBox(a_crv)
     
@@ -1272,54 +2867,69 @@ def potential_overlap_lines(a_crv, overlap_threshold=0.5):
     return p_lines
     
 
-def select_overlapping_lines():
+def select_overlapping_lines(overlap_threshold=0.5, sel_lines=None, workers=1, incremental=False):
     """
     Select lines that are overlapped with other lines or polylines. Only the shorter lines with a lighter
     line weight that overlaps with another line or polyline will be selected. Overlapping is defined by distance
     less or equal to a minimum threshold.
+    Lines are only compared with the other curves in the selection. See _find_overlapping_segments().
     
     Arguments:
+    overlap_threshold[opt] -- [num]maximum distance between two lines seen as overlapped
+    sel_lines[opt] -- [list]the curves to query. If omitted, they are selected
+    workers[opt] -- [int]if more than 1, the overlaps are found in tiles shared by the workers, 
+                    see _find_overlapping_segments_tiled()
+    incremental[opt] -- [bool]if True, only the lines changed since the last run with incremental 
+                        are examined again, see _find_overlapping_segments_incremental()
     
     Returns:
     An array of the overlapping lines
 	If no lines are overlapped, None
     """
-    sel_lines = rs.GetObjects(message="Select Objects to query", filter=4, preselect=True)
+    if sel_lines is None:
+        sel_lines = rs.GetObjects(message="Select Objects to query", filter=4, preselect=True)
     
     rs.UnselectAllObjects()
-    lines_sorted = sort_by_print_width(sel_lines)
+    
+    # Read every segment and print width once and find the overlapping pairs among nearly collinear segments
+    table = _make_segment_table(sel_lines, layers=True)
+    crv_ids, offsets, print_width = table['crv_ids'], table['offsets'], table['print_width']
+    sources_sorted = sorted(range(len(crv_ids)), key=lambda source:print_width[source], reverse=True)
+    
+    # Only lines can be selected
+    line_segments = set([])
+    for source in range(len(crv_ids)):
+        if offsets[source+1] - offsets[source] == 1 and table['is_line'][source]:
+            line_segments.add(offsets[source])
+    
+    if incremental:
+        overlap_dict = _find_overlapping_segments_incremental(table, line_segments, overlap_threshold, workers)
+    elif workers > 1:
+        overlap_dict = _find_overlapping_segments_tiled(table, line_segments, overlap_threshold, workers)
+    else:
+        overlap_dict = _find_overlapping_segments(table, line_segments, overlap_threshold)
     
     lines_to_select = []
+    selected = set()
     
 	# Iterate to examine each curve, print width max to min
-    for a_crv in lines_sorted:
-        if a_crv not in lines_to_select:
-            endpoint_lst = []
-            
-            if rs.IsPolyline(a_crv):
-                polyline_pts = rs.PolylineVertices(a_crv)
-                for i in range(len(polyline_pts)-1):
-                    endpoint_lst.append((polyline_pts[i], polyline_pts[i+1]))
-            elif rs.IsLine(a_crv):
-                endpoint_lst.append((rs.CurveStartPoint(a_crv), rs.CurveEndPoint(a_crv)))
+    for source in sources_sorted:
+        if crv_ids[source] not in selected:
             
-            else:continue
-            
-            for endpoints in endpoint_lst:
-                p_lines = potential_overlap_lines(a_crv)
-                for a_p_line in p_lines:
-                    if a_p_line not in lines_to_select:
-                        a_p_endpoints = (rs.CurveStartPoint(a_p_line), rs.CurveEndPoint(a_p_line))
-                        
-                        if a_p_line != a_crv:
-                            if is_line_overlapped(a_p_endpoints, endpoints):
-                                lines_to_select.append(a_p_line)
+            for index in range(offsets[source], offsets[source+1]):
+                for p_index in overlap_dict.get(index, []):
+                    p_source = table['source'][p_index]
+                    a_p_line = crv_ids[p_source]
+                    
+                    if p_source != source and a_p_line not in selected and print_width[source] >= print_width[p_source]:
+                        lines_to_select.append(a_p_line)
+                        selected.add(a_p_line)
 
     if lines_to_select:
         rs.SelectObjects(lines_to_select)
         return lines_to_select
     else:
-        print "No overlapped lines found"
+        print("No overlapped lines found")
 
 
 def select_overlapping_lines_old():
@@ -1381,7 +2991,7 @@ def select_overlapping_lines_old():
         rs.SelectObjects(lines_to_select)
         return lines_to_select
     else:
-        print "No overlapped lines found"
+        print("No overlapped lines found")
 		
 		
 def _get_linework_layer_by_width():
@@ -1458,51 +3068,618 @@ def is_line_overlapped(endpoints_1, endpoints_2, overlap_threshold=0.5):
         return dist <= overlap_threshold
 
 
-if __name__ == "__main__":
+_PARALLEL_TOLERANCE = math.pi/180
+"""
+Angle tolerance in radians under which two vectors are parallel, the same as rs.IsVectorParallelTo()
+"""
+
+
+def _segment_point_distance(start, end, pt):
+    """
+    Returns the distance from a point to a segment defined by its two end points.
+    The same as rs.LineMinDistanceTo() without calling into Rhino.
+    """
+    dx, dy, dz = end[0] - start[0], end[1] - start[1], end[2] - start[2]
+    px, py, pz = pt[0] - start[0], pt[1] - start[1], pt[2] - start[2]
     
-    if WHAT_TO_DO:
-        rs.AddLayer(DRAWING_NAME)
-        if WHAT_TO_DO == 1:
-            find_blocks()
-            
-        elif WHAT_TO_DO == 1.1:
-            print_keyword_in_name()
+    length_sq = dx*dx + dy*dy + dz*dz
+    t = 0.0
+    if length_sq:
+        t = min(1.0, max(0.0, (px*dx + py*dy + pz*dz)/length_sq))
+    
+    px, py, pz = px - dx*t, py - dy*t, pz - dz*t
+    return math.sqrt(px*px + py*py + pz*pz)
+
+
+def _is_segment_overlapped(endpoints_1, endpoints_2, overlap_threshold=0.5):
+    """
+    The same test as is_line_overlapped() without calling into Rhino.
+    
+    Argument:
+    endpoints_1[tuple] -- the pair of end points of one line
+    endpoints_2[tuple] -- the pair of end points of the other line
+    
+    Returns:
+    True or False
+    """
+    crv_start, crv_end = endpoints_1
+    crv2_start, crv2_end = endpoints_2
+    
+    # Verify if the two lines are parallel
+    v1 = (crv_end[0] - crv_start[0], crv_end[1] - crv_start[1], crv_end[2] - crv_start[2])
+    v2 = (crv2_end[0] - crv2_start[0], crv2_end[1] - crv2_start[1], crv2_end[2] - crv2_start[2])
+    length = math.sqrt((v1[0]*v1[0] + v1[1]*v1[1] + v1[2]*v1[2]) * (v2[0]*v2[0] + v2[1]*v2[1] + v2[2]*v2[2]))
+    
+    if not length or abs(v1[0]*v2[0] + v1[1]*v2[1] + v1[2]*v2[2])/length < math.cos(_PARALLEL_TOLERANCE):
+        return False
+    
+    dist = _segment_point_distance(crv2_start, crv2_end, crv_start)
+    dist_2 = _segment_point_distance(crv2_start, crv2_end, crv_end)
     
-        elif WHAT_TO_DO == 2:
-            purge_not_used_blocks()
-            replace_dict = _make_block_replace_dict()
-            replace_same_block(replace_dict)
+    if abs(dist - dist_2) > overlap_threshold:
+        return False
+    
+    return dist <= overlap_threshold
+
+
+def _make_collinear_buckets(table, overlap_threshold):
+    """
+    Sort segments into buckets of nearly collinear segments for _find_overlapping_segments().
+    
+    A bucket is keyed by the segment's direction angle quantized by _PARALLEL_TOLERANCE and 
+    its perpendicular offset, measured in the bucket's direction, quantized by overlap_threshold.
+    A segment that is not exactly in the bucket's direction spans its offset range and is put
+    into every bucket in the range.
+    
+    Arguments:
+    table -- the segment table returned by _make_segment_table()
+    overlap_threshold -- [num]the size of an offset step
+    
+    Returns:
+    The mapping of each bucket[(angle step, offset step)] to a list of 
+    (start, end, segment index) of the segment's interval along the bucket's direction
+    The number of angle steps between 0 and pi
+    A list of the angle step of each segment, None for segments without length in plan
+    """
+    angle_count = int(math.ceil(math.pi/_PARALLEL_TOLERANCE))
+    bucket_dict = {}
+    angle_lst = []
+    
+    x0, y0, x1, y1 = table['x0'], table['y0'], table['x1'], table['y1']
+    
+    for index in range(len(x0)):
+        dx, dy = x1[index] - x0[index], y1[index] - y0[index]
+        if not dx and not dy:
+            angle_lst.append(None)
+            continue
+        
+        angle_step = int((math.atan2(dy, dx) % math.pi)/_PARALLEL_TOLERANCE) % angle_count
+        angle_lst.append(angle_step)
+        
+        along, offset = _bucket_coordinates(angle_step, (x0[index], y0[index]), (x1[index], y1[index]))
+        for offset_step in range(int(offset[0]//overlap_threshold), int(offset[1]//overlap_threshold) + 1):
+            bucket_dict.setdefault((angle_step, offset_step), []).append((along[0], along[1], index))
+    
+    return bucket_dict, angle_count, angle_lst
+
+
+def _bucket_coordinates(angle_step, start, end):
+    """
+    Returns the (min, max) interval of a segment along the direction of an angle step 
+    and the (min, max) interval of its offset perpendicular to the direction.
+    """
+    angle = (angle_step + 0.5) * _PARALLEL_TOLERANCE
+    cos, sin = math.cos(angle), math.sin(angle)
+    
+    along_0 = start[0]*cos + start[1]*sin
+    along_1 = end[0]*cos + end[1]*sin
+    offset_0 = start[1]*cos - start[0]*sin
+    offset_1 = end[1]*cos - end[0]*sin
+    
+    return (min(along_0, along_1), max(along_0, along_1)), (min(offset_0, offset_1), max(offset_0, offset_1))
+
+
+def _sweep_intervals(items, queries):
+    """
+    Find every pair of overlapping intervals between two lists of intervals with a sweep along the line.
+    
+    Arguments:
+    items -- [list] of (start, end, index)
+    queries -- [list] of (start, end, index)
+    
+    Returns:
+    A list of (query index, item index) of the overlapping intervals
+    """
+    events = [(start, 0, end, index) for start, end, index in items]
+    events.extend([(start, 1, end, index) for start, end, index in queries])
+    events.sort()
+    
+    pairs = []
+    active_items = []
+    active_queries = []
+    
+    for start, is_query, end, index in events:
+        if is_query:
+            active_items = [item for item in active_items if item[0] >= start]
+            for item_end, item_index in active_items:
+                pairs.append((index, item_index))
+            active_queries.append((end, index))
+        else:
+            active_queries = [query for query in active_queries if query[0] >= start]
+            for query_end, query_index in active_queries:
+                pairs.append((query_index, index))
+            active_items.append((end, index))
+    
+    return pairs
+
+
+def _find_overlapping_segments(table, candidates, overlap_threshold=0.5):
+    """
+    Find where a candidate segment overlaps another segment as is_line_overlapped() defines.
+    
+    Segments are put into buckets by direction and perpendicular offset (see _make_collinear_buckets()),
+    so a segment is only compared with the segments in the neighbouring buckets, and only with those 
+    whose intervals along the bucket's direction overlap with its own, found with a sweep.
+    
+    Arguments:
+    table -- the segment table returned by _make_segment_table()
+    candidates -- [set] of the indices of the segments that may be found overlapping
+    overlap_threshold[opt] -- [num]maximum distance between two lines seen as overlapped
+    
+    Returns:
+    A dictionary of each segment index to a sorted list of the indices of 
+    the candidate segments overlapping it
+    """
+    bucket_dict, angle_count, angle_lst = _make_collinear_buckets(table, overlap_threshold)
+    source = table['source']
+    
+    # Each segment queries the buckets of its own and the neighbouring angle steps
+    # within the overlap threshold of its offset
+    query_dict = {}
+    for index in range(len(source)):
+        if angle_lst[index] is None:
+            continue
+        
+        start, end = _table_points(table, index)
+        for angle_step in (angle_lst[index] - 1, angle_lst[index], angle_lst[index] + 1):
+            angle_step %= angle_count
+            along, offset = _bucket_coordinates(angle_step, start, end)
             
-        elif WHAT_TO_DO == 3:
-            block_set = set(rs.SelectedObjects())
-            blocks_to_groups(block_set)
+            for offset_step in range(int((offset[0] - overlap_threshold)//overlap_threshold),
+                                     int((offset[1] + overlap_threshold)//overlap_threshold) + 1):
+                if (angle_step, offset_step) in bucket_dict:
+                    query_dict.setdefault((angle_step, offset_step), []).append(
+                        (along[0] - overlap_threshold, along[1] + overlap_threshold, index))
+    
+    overlap_dict = {}
+    tested = set()
+    
+    for bucket, queries in query_dict.items():
+        for index, p_index in _sweep_intervals(bucket_dict[bucket], queries):
+            if p_index in candidates and index != p_index and (index, p_index) not in tested:
+                tested.add((index, p_index))
+                
+                if source[index] != source[p_index] and \
+                   _is_segment_overlapped(_table_points(table, p_index), _table_points(table, index), overlap_threshold):
+                    overlap_dict.setdefault(index, []).append(p_index)
     
-        elif WHAT_TO_DO == 4:
-            organize_layers()
+    for p_indices in overlap_dict.values():
+        p_indices.sort()
     
-        elif WHAT_TO_DO == 5:
-            groups = rs.GetObjects(message="select groups", preselect=True)
-            extend_to_closest_group(groups)    
+    return overlap_dict
+
+
+def _find_overlapping_segments_tiled(table, candidates, overlap_threshold=0.5, workers=2):
+    """
+    Find the same overlaps as _find_overlapping_segments() by splitting the segments into 
+    square tiles, which are searched by the workers at the same time.
     
-        elif WHAT_TO_DO == 6:
-            purge_empty_layers()
+    A segment is put into every tile its bounding box, padded by overlap_threshold, touches. 
+    Two overlapping segments have a point within overlap_threshold of both of them, so they share 
+    the tile of that point. Overlaps found in several tiles are merged.
     
-        elif WHAT_TO_DO == 7:
-            set_layers(MARKETING_LINE_LAYERS)
+    Arguments:
+    table -- the segment table returned by _make_segment_table()
+    candidates -- [set] of the indices of the segments that may be found overlapping
+    overlap_threshold[opt] -- [num]maximum distance between two lines seen as overlapped
+    workers[opt] -- [int]the number of workers, see _map_parallel()
+    
+    Returns:
+    A dictionary of each segment index to a sorted list of the indices of 
+    the candidate segments overlapping it
+    """
+    count = len(table['source'])
+    if not count:
+        return {}
+    
+    bboxes = [_segment_bbox(*(_table_points(table, index) + (overlap_threshold,))) for index in range(count)]
+    
+    # About four tiles for each worker so that they finish at similar times
+    width = max([bbox[2] for bbox in bboxes]) - min([bbox[0] for bbox in bboxes])
+    height = max([bbox[3] for bbox in bboxes]) - min([bbox[1] for bbox in bboxes])
+    tile_size = max(width, height)/math.ceil(math.sqrt(workers*4)) or 1.0
+    tile_size = max(tile_size, overlap_threshold*4)
+    
+    tasks = []
+    for tile, indices in sorted(_make_segment_grid(bboxes, tile_size).items()):
+        tile_candidates = set([local for local, index in enumerate(indices) if index in candidates])
+        if tile_candidates:
+            tasks.append((_table_rows(table, indices), tile_candidates, overlap_threshold, indices))
+    
+    overlap_sets = {}
+    for pairs in _map_parallel(_find_overlaps_in_tile, tasks, workers):
+        for index, p_index in pairs:
+            overlap_sets.setdefault(index, set()).add(p_index)
+    
+    overlap_dict = {}
+    for index, p_indices in overlap_sets.items():
+        overlap_dict[index] = sorted(p_indices)
+    
+    return overlap_dict
+
+
+_OVERLAP_STICKY_KEY = 'PresentationHelper.select_overlapping_lines'
+
+
+def _find_overlapping_segments_incremental(table, candidates, overlap_threshold=0.5, workers=1):
+    """
+    Find the same overlaps as _find_overlapping_segments(), reusing the overlaps found in the last run
+    in the same document, kept in scriptcontext.sticky.
+    
+    Curves whose segments or candidacy changed since the last run, and new curves, are dirty. 
+    The overlaps of dirty and deleted curves are dropped, and the dirty segments are searched again 
+    with the segments near them, found in a grid of the segments kept with the overlaps.
+    The first run, or a run with another overlap_threshold, searches all segments.
+    
+    Arguments:
+    table -- the segment table returned by _make_segment_table()
+    candidates -- [set] of the indices of the segments that may be found overlapping
+    overlap_threshold[opt] -- [num]maximum distance between two lines seen as overlapped
+    workers[opt] -- [int]the number of workers of a search of all segments, see _find_overlapping_segments_tiled()
+    
+    Returns:
+    A dictionary of each segment index to a sorted list of the indices of 
+    the candidate segments overlapping it
+    """
+    # Each segment is known by (curve Guid, number of the segment in the curve)
+    keys = []
+    crv_segs = {}
+    for index, source in enumerate(table['source']):
+        a_crv = table['crv_ids'][source]
+        pts = crv_segs.setdefault(a_crv, [])
+        keys.append((a_crv, len(pts)))
+        pts.append(_table_points(table, index))
+    key_index = dict([(key, index) for index, key in enumerate(keys)])
+    cand_crvs = set([keys[index][0] for index in candidates])
+    
+    doc_serial = getattr(sc.doc, 'RuntimeSerialNumber', None)
+    state = sc.sticky.get(_OVERLAP_STICKY_KEY)
+    
+    if not state or state['doc'] != doc_serial or state['threshold'] != overlap_threshold:
+        if workers > 1:
+            overlap_dict = _find_overlapping_segments_tiled(table, candidates, overlap_threshold, workers)
+        else:
+            overlap_dict = _find_overlapping_segments(table, candidates, overlap_threshold)
+        
+        pairs = set()
+        for index, p_indices in overlap_dict.items():
+            for p_index in p_indices:
+                pairs.add((keys[index], keys[p_index]))
+        
+        bboxes = [_segment_bbox(start, end, overlap_threshold) for start, end in [crv_segs[key[0]][key[1]] for key in keys]]
+        cell_size = _grid_cell_size(bboxes, overlap_threshold*4)
+        grid = {}
+        for key, bbox in zip(keys, bboxes):
+            _grid_insert(grid, cell_size, bbox, key)
+        
+        sc.sticky[_OVERLAP_STICKY_KEY] = {'doc':doc_serial, 'threshold':overlap_threshold, 'segments':crv_segs, 
+                                          'candidates':cand_crvs, 'pairs':pairs, 'grid':grid, 'cell_size':cell_size}
+        return overlap_dict
+    
+    old_segs = state['segments']
+    grid = state['grid']
+    cell_size = state['cell_size']
+    
+    dirty = set([a_crv for a_crv, pts in crv_segs.items() 
+                 if old_segs.get(a_crv) != pts or (a_crv in cand_crvs) != (a_crv in state['candidates'])])
+    changed = dirty | (set(old_segs) - set(crv_segs))
+    
+    pairs = set([pair for pair in state['pairs'] if pair[0][0] not in changed and pair[1][0] not in changed])
+    
+    # Take the old segments of the changed curves out of the grid and put the new ones in
+    for a_crv in changed:
+        for k, (start, end) in enumerate(old_segs.get(a_crv, [])):
+            _grid_insert(grid, cell_size, _segment_bbox(start, end, overlap_threshold), (a_crv, k), remove=True)
+    
+    near = set()
+    for a_crv in dirty:
+        for k, (start, end) in enumerate(crv_segs[a_crv]):
+            bbox = _segment_bbox(start, end, overlap_threshold)
+            _grid_insert(grid, cell_size, bbox, (a_crv, k))
+            near.update(_grid_query(grid, cell_size, bbox))
+    
+    # Search the dirty segments with their neighbours, and keep the overlaps with a dirty side
+    if near:
+        near = sorted(near)
+        local_table = _table_rows(table, [key_index[key] for key in near])
+        local_candidates = set([local for local, key in enumerate(near) if key[0] in cand_crvs])
+        for local, p_locals in _find_overlapping_segments(local_table, local_candidates, overlap_threshold).items():
+            for p_local in p_locals:
+                if near[local][0] in dirty or near[p_local][0] in dirty:
+                    pairs.add((near[local], near[p_local]))
+    
+    state.update({'segments':crv_segs, 'candidates':cand_crvs, 'pairs':pairs})
+    
+    overlap_dict = {}
+    for key, p_key in pairs:
+        overlap_dict.setdefault(key_index[key], []).append(key_index[p_key])
+    for p_indices in overlap_dict.values():
+        p_indices.sort()
+    
+    return overlap_dict
+
+
+def _grid_insert(grid, cell_size, bbox, key, remove=False):
+    """
+    Add a key to, or remove it from, the cells of a grid like _make_segment_grid() makes that bbox touches.
+    """
+    for i in range(int(bbox[0]//cell_size), int(bbox[2]//cell_size) + 1):
+        for j in range(int(bbox[1]//cell_size), int(bbox[3]//cell_size) + 1):
+            if remove:
+                if (i, j) in grid and key in grid[(i, j)]:
+                    grid[(i, j)].remove(key)
+            else:
+                grid.setdefault((i, j), []).append(key)
+
+
+def _find_overlaps_in_tile(task):
+    """
+    Run _find_overlapping_segments() on the segments of one tile.
     
-        elif WHAT_TO_DO == 8:
-            set_layers(HATCH_COLORS)
+    Arguments:
+    task -- (segment table of the tile, see _table_rows(), indices of the candidates in the tile, 
+             overlap_threshold, the index in all segments of each segment of the tile)
     
-        elif WHAT_TO_DO == 9:
-            move_label_to_layer()
+    Returns:
+    A list of (segment index, overlapping candidate segment index) in all segments
+    """
+    tile_table, tile_candidates, overlap_threshold, indices = task
     
-        elif WHAT_TO_DO == 10:
-            objs = rs.GetObjects(message='select drawing', preselect=True)
-            frame_pt, scale = set_print_frame(objs, frame_size=(11,8.5), scale=None)
-            add_legends(scale, frame_pt)
+    pairs = []
+    for local, p_locals in _find_overlapping_segments(tile_table, tile_candidates, overlap_threshold).items():
+        for p_local in p_locals:
+            pairs.append((indices[local], indices[p_local]))
     
-        elif WHAT_TO_DO == 11:
-            assign_standard_print()
+    return pairs
+
+
+def _map_parallel(function, items, workers):
+    """
+    Returns [function(item) for item in items], shared by the given number of workers.
+    
+    In Rhino (IronPython, without a global interpreter lock) the workers are threads. In CPython they 
+    are processes forked from this one, so function must be defined at the top of a module and must not 
+    call rs. Where processes cannot be forked, the items are done one by one.
+    """
+    if workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    
+    if sys.platform == 'cli':
+        import threading
+        
+        results = [None]*len(items)
+        errors = []
+        
+        def work(start):
+            try:
+                for i in range(start, len(items), workers):
+                    results[i] = function(items[i])
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=work, args=(start,)) for start in range(min(workers, len(items)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
+    
+    import multiprocessing
+    if hasattr(multiprocessing, 'get_context'):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return [function(item) for item in items]
+        context = multiprocessing.get_context('fork')
+    elif hasattr(os, 'fork'):
+        context = multiprocessing
+    else:
+        return [function(item) for item in items]
+    
+    pool = context.Pool(min(workers, len(items)))
+    try:
+        return pool.map(function, items, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+@contextlib.contextmanager
+def batch_edit(description):
+    """
+    Run the edits in a with statement as one step that can be undone at once, without redrawing 
+    the views after every edit. Redraw is restored even if the edits fail.
+    Get user input before the with statement, as the views are not redrawn in it.
+    
+    Arguments:
+    description -- [str]the name of the undo record
+    
+    Usage:
+    with batch_edit('Organize Layers'):
+        organize_layers()
+    """
+    redraw = rs.EnableRedraw(False)
+    undo_record = sc.doc.BeginUndoRecord(description)
+    try:
+        yield
+    finally:
+        if undo_record:
+            sc.doc.EndUndoRecord(undo_record)
+        rs.EnableRedraw(redraw)
+
+
+_rs_timer = getattr(time, 'perf_counter', None) or time.clock
+
+
+def start_rs_profile():
+    """
+    Replace rs in this module with a copy whose functions record their calls, until stop_rs_profile().
+    
+    Returns:
+    A dictionary of (rs function name, calling function name) to [call count, total seconds], 
+    filled as the calls are made
+    """
+    global rs
+    
+    stats = {}
+    profiled = types.ModuleType(rs.__name__)
+    profiled.__dict__.update(rs.__dict__)
+    profiled._rs_module = rs
+    profiled._rs_stats = stats
+    
+    for name, attr in rs.__dict__.items():
+        if isinstance(attr, (types.FunctionType, types.BuiltinFunctionType)):
+            setattr(profiled, name, _profile_rs_function(name, attr, stats))
+    
+    rs = profiled
+    return stats
+
+
+def _profile_rs_function(name, function, stats):
+    """
+    Returns a wrapper of an rs function that adds each call's time to stats by the calling function.
+    """
+    def wrapper(*args, **kwargs):
+        caller = sys._getframe(1).f_code.co_name
+        start = _rs_timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record = stats.get((name, caller))
+            if record is None:
+                record = stats[(name, caller)] = [0, 0.0]
+            record[0] += 1
+            record[1] += _rs_timer() - start
+    
+    wrapper.__name__ = name
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def stop_rs_profile():
+    """
+    Restore rs replaced by start_rs_profile().
+    
+    Returns:
+    The dictionary of the recorded calls, as start_rs_profile() returns
+    """
+    global rs
+    
+    stats = getattr(rs, '_rs_stats', {})
+    rs = getattr(rs, '_rs_module', rs)
+    return stats
+
+
+def print_rs_profile(stats, limit=30):
+    """
+    Print the rs calls recorded by start_rs_profile(), the most costly first.
+    
+    Arguments:
+    stats -- [dict]the recorded calls
+    limit[opt] -- [int]the number of lines to print. If None, all lines are printed
+    
+    Returns:
+    None
+    """
+    total = sum([record[1] for record in stats.values()])
+    count = sum([record[0] for record in stats.values()])
+    print('%d rhinoscriptsyntax calls in %.3f s' % (count, total))
+    print('%10s %10s %12s  %s' % ('calls', 'total s', 'per call ms', 'function <- caller'))
+    
+    lines = sorted(stats.items(), key=lambda item: item[1][1], reverse=True)
+    if limit is not None:
+        lines = lines[:limit]
+    for (name, caller), (calls, seconds) in lines:
+        print('%10d %10.3f %12.4f  %s <- %s' % (calls, seconds, seconds*1000.0/calls, name, caller))
+
+
+if __name__ == "__main__":
+    
+    if WHAT_TO_DO:
+        if PROFILE_RS_CALLS:
+            start_rs_profile()
+        
+        try:
+            rs.AddLayer(DRAWING_NAME)
+            if WHAT_TO_DO == 1:
+                with batch_edit('Filter Block Instances'):
+                    find_blocks()
+            
+            elif WHAT_TO_DO == 1.1:
+                print_keyword_in_name()
+    
+            elif WHAT_TO_DO == 2:
+                with batch_edit('Replace Same Blocks'):
+                    purge_not_used_blocks()
+                    replace_dict = _make_block_replace_dict()
+                    replace_same_block(replace_dict, REPLACE_COMMIT)
+            
+            elif WHAT_TO_DO == 3:
+                block_set = set(rs.SelectedObjects())
+                with batch_edit('Blocks to Groups'):
+                    blocks_to_groups(block_set)
+    
+            elif WHAT_TO_DO == 4:
+                with batch_edit('Organize Layers'):
+                    organize_layers()
+    
+            elif WHAT_TO_DO == 5:
+                groups = rs.GetObjects(message="select groups", preselect=True)
+                with batch_edit('Extend Curves to Closest Others'):
+                    extend_to_closest_group(groups, workers=PARALLEL_WORKERS, rejoin=EXTEND_REJOIN)
+    
+            elif WHAT_TO_DO == 6:
+                with batch_edit('Delete Empty Layers'):
+                    purge_empty_layers()
+    
+            elif WHAT_TO_DO == 7:
+                with batch_edit('Add Standard Line Work Layers'):
+                    set_layers(MARKETING_LINE_LAYERS)
+    
+            elif WHAT_TO_DO == 8:
+                with batch_edit('Add Standard Color Layers'):
+                    set_layers(HATCH_COLORS)
+    
+            elif WHAT_TO_DO == 9:
+                with batch_edit('Move Text to Layer'):
+                    move_label_to_layer()
+    
+            elif WHAT_TO_DO == 10:
+                objs = rs.GetObjects(message='select drawing', preselect=True)
+                with batch_edit('Add Print Frame, Scale and Legends'):
+                    frame_pt, scale = set_print_frame(objs, frame_size=(11,8.5), scale=None)
+                    add_legends(scale, frame_pt)
+    
+            elif WHAT_TO_DO == 11:
+                with batch_edit('Assign Standard Print Width'):
+                    assign_standard_print()
+        
+            elif WHAT_TO_DO == 12:
+                sel_lines = rs.GetObjects(message="Select Objects to query", filter=4, preselect=True)
+                if sel_lines:
+                    with batch_edit('Select Overlapping Lines'):
+                        select_overlapping_lines(sel_lines=sel_lines, workers=PARALLEL_WORKERS, incremental=True)
         
-        elif WHAT_TO_DO == 12:
-            select_overlapping_lines()
+        finally:
+            if PROFILE_RS_CALLS:
+                print_rs_profile(stop_rs_profile())
@@ -0,0 +1,526 @@
+"""
+Run PresentationHelper over a folder of .3dm files without Rhino.
+
+Each file is read with rhino3dm into the in-memory rhinoscriptsyntax in this folder,
+the chosen definitions run on it and the result is written to the output folder
+under the same name. Files are processed in a pool of worker processes, one file per worker.
+
+Usage:
+python batch.py INPUT_FOLDER OUTPUT_FOLDER [--drawing-name NAME] [--workers 4]
+                [--ops organize_layers assign_standard_print select_overlapping_lines purge_empty_layers]
+
+DRAWING_NAME is the file name without extension unless --drawing-name is given.
+Overlapping lines found by select_overlapping_lines are put into the group 'Overlapping Lines' for review.
+
+Requires rhino3dm (pip install rhino3dm). Curves that are not lines or polylines are
+sampled into polylines while the script runs. The file read is updated and written, so
+what the script does not touch (dimension styles, hatch patterns, views, materials...)
+is kept and objects the script does not change keep their original geometry. New or
+changed text is written as text dots and new or changed hatches as their boundaries,
+as rhino3dm cannot create those.
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import rhinoscriptsyntax as rs
+
+try:
+    import rhino3dm
+except ImportError:
+    rhino3dm = None
+
+from benchmark import load_script
+
+OPERATIONS = ['organize_layers', 'assign_standard_print', 'select_overlapping_lines', 'purge_empty_layers']
+OVERLAP_GROUP = 'Overlapping Lines'
+CURVE_SAMPLES = 64
+
+# rhinoscriptsyntax object types of the geometry that is only carried through
+GEOMETRY_TYPES = {'Brep': 16, 'Extrusion': 1073741824, 'Mesh': 32, 'NurbsSurface': 8,
+                  'PlaneSurface': 8, 'RevSurface': 8, 'SubD': 262144, 'PointCloud': 2}
+
+_script = None
+
+
+def _color(color):
+    return (color[0], color[1], color[2])
+
+
+def _xform_rows(xform):
+    return [[getattr(xform, 'M%d%d' % (i, j)) for j in range(4)] for i in range(4)]
+
+
+def _xform_from_rows(rows):
+    xform = rhino3dm.Transform(1.0)
+    for i in range(4):
+        for j in range(4):
+            setattr(xform, 'M%d%d' % (i, j), rows[i][j])
+    return xform
+
+
+def _point(pt):
+    return (pt.X, pt.Y, pt.Z)
+
+
+def _signature(obj):
+    """
+    The state of an in-memory object that decides if its original geometry can be written back.
+    """
+    xform = obj.xform and tuple([tuple(row) for row in obj.xform])
+    return (obj.kind, tuple([tuple(pt) for pt in obj.points]), obj.text, obj.block, xform)
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def load_3dm(path):
+    """
+    Read a .3dm file into a new in-memory document.
+
+    Returns:
+    A dictionary with the read file ('model'), the in-memory name of each of its layers and groups 
+    by index ('layers', 'groups') and the original geometry and attributes of each in-memory object 
+    ('originals'), used by save_3dm()
+    """
+    model = rhino3dm.File3dm.Read(path)
+    if model is None:
+        raise IOError('%s cannot be read as a .3dm file' % path)
+
+    rs.reset()
+    source = {'model': model, 'originals': {}}
+
+    linetype_names = {}
+    for linetype in model.Linetypes:
+        linetype_names[linetype.Index] = linetype.Name
+
+    layer_names = {}
+    for index, layer in enumerate(model.Layers):
+        name = rs.AddLayer(layer.FullPath)
+        rs.LayerColor(name, _color(layer.Color))
+        rs.LayerPrintColor(name, _color(layer.PlotColor))
+        # A print width of -1 is No Print, kept as it is
+        rs.LayerPrintWidth(name, layer.PlotWeight)
+        rs.LayerVisible(name, layer.Visible)
+        rs.LayerLocked(name, layer.Locked)
+        rs.LayerLinetype(name, linetype_names.get(layer.LinetypeIndex, 'Continuous'))
+        layer_names[index] = name
+
+    group_names = {}
+    for index, group in enumerate(model.Groups):
+        group_names[index] = rs.AddGroup(group.Name or None)
+
+    objects = {}
+    for model_obj in model.Objects:
+        objects[model_obj.Attributes.Id] = model_obj
+
+    tables = {'layers': layer_names, 'linetypes': linetype_names, 'groups': group_names,
+              'objects': objects, 'idefs': {}, 'model': model}
+    for idef in model.InstanceDefinitions:
+        _load_definition(idef, tables, source)
+
+    for model_obj in model.Objects:
+        if not model_obj.Attributes.IsInstanceDefinitionObject:
+            _load_object(model_obj, tables, source)
+
+    source['layers'] = layer_names
+    source['groups'] = group_names
+    rs.CurrentLayer(layer_names.get(0, 'Default'))
+    return source
+
+
+def _load_definition(idef, tables, source):
+    """
+    Add a block definition, after the definitions nested in it. Returns its name.
+    """
+    if idef.Id in tables['idefs']:
+        return tables['idefs'][idef.Id]
+    # Reserve the name against cycles
+    tables['idefs'][idef.Id] = idef.Name
+
+    member_ids = []
+    for object_id in idef.GetObjectIds():
+        model_obj = tables['objects'].get(object_id)
+        if model_obj is not None:
+            obj_id = _load_object(model_obj, tables, source)
+            if obj_id is not None:
+                member_ids.append(obj_id)
+
+    if member_ids:
+        rs.AddBlock(member_ids, (0, 0, 0), idef.Name, delete_input=True)
+        # AddBlock() copies the objects in order, keep their originals
+        for old_id, new_id in zip(member_ids, rs.BlockObjects(idef.Name)):
+            source['originals'][new_id] = source['originals'].pop(old_id)
+    return idef.Name
+
+
+def _load_object(model_obj, tables, source):
+    """
+    Add an object of the file to the in-memory document. Returns its id, or None if it is not supported.
+    """
+    geometry = model_obj.Geometry
+    attributes = model_obj.Attributes
+    rs.CurrentLayer(tables['layers'].get(attributes.LayerIndex, 'Default'))
+    kind = type(geometry).__name__
+
+    if kind == 'LineCurve':
+        obj_id = rs.AddLine(_point(geometry.PointAtStart), _point(geometry.PointAtEnd))
+    elif isinstance(geometry, rhino3dm.Curve):
+        polyline = geometry.TryGetPolyline()
+        if polyline is not None and polyline.Count >= 2:
+            obj_id = rs.AddPolyline([_point(polyline[i]) for i in range(polyline.Count)])
+        else:
+            domain = geometry.Domain
+            pts = [_point(geometry.PointAt(domain.T0 + (domain.T1 - domain.T0)*i/float(CURVE_SAMPLES)))
+                   for i in range(CURVE_SAMPLES + 1)]
+            obj_id = rs.AddPolyline(pts)
+            # Sampled curves are not polylines, as AddCircle() marks them
+            rs.document().objects[obj_id].text = 'circle'
+    elif kind == 'Point':
+        obj_id = rs.AddPoint(_point(geometry.Location))
+    elif kind == 'TextDot':
+        obj_id = rs.AddText(geometry.Text, _point(geometry.Point))
+    elif kind == 'Text':
+        obj_id = rs.AddText(geometry.PlainText, _point(geometry.Plane.Origin), geometry.GetTextHeight())
+    elif kind == 'InstanceReference':
+        idef = tables['model'].InstanceDefinitions.FindId(geometry.ParentIdefId)
+        if idef is None:
+            return None
+        block_name = _load_definition(idef, tables, source)
+        if not rs.IsBlock(block_name):
+            return None
+        obj_id = rs.InsertBlock2(block_name, _xform_rows(geometry.Xform))
+    else:
+        bbox = geometry.GetBoundingBox()
+        pts = [_point(bbox.Min), _point(bbox.Max)]
+        if kind == 'Hatch':
+            obj_id = rs.add_object('hatch', pts)
+        else:
+            obj_id = rs.add_object('geometry', pts, GEOMETRY_TYPES.get(kind, 0))
+
+    obj = rs.document().objects[obj_id]
+    obj.color = rs.Color(*_color(attributes.ObjectColor))
+    obj.color_source = int(attributes.ColorSource)
+    obj.print_color = rs.Color(*_color(attributes.PlotColor))
+    obj.print_color_source = int(attributes.PlotColorSource)
+    obj.print_width_source = int(attributes.PlotWeightSource)
+    if int(attributes.LinetypeSource) == 1:
+        obj.linetype = tables['linetypes'].get(attributes.LinetypeIndex, 'Continuous')
+    obj.hidden = int(attributes.Mode) == 1 or not attributes.Visible
+    obj.locked = int(attributes.Mode) == 2
+
+    for group_index in attributes.GetGroupList() or ():
+        if group_index in tables['groups']:
+            rs.AddObjectToGroup(obj_id, tables['groups'][group_index])
+
+    source['originals'][obj_id] = (geometry, attributes, _signature(obj))
+    return obj_id
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+def save_3dm(path, source):
+    """
+    Write the in-memory document to a .3dm file by updating the file it was read from, so that its
+    settings and the tables the script does not use are kept. Layers, groups and the attributes of 
+    unchanged objects are updated in place, changed and new objects replace the originals, and deleted 
+    layers, groups and objects are removed. rhino3dm cannot remove block definitions or change their 
+    geometry, so only the attributes of the objects of existing definitions are updated and 
+    the definitions the script deleted are left without objects.
+    """
+    model = source['model']
+    originals = source['originals']
+    doc = rs.document()
+
+    linetype_index = {}
+    for linetype in model.Linetypes:
+        linetype_index[linetype.Name] = linetype.Index
+
+    # Parents before their children
+    model_layers = dict([(name, model.Layers.FindIndex(index)) for index, name in source['layers'].items()])
+    layer_index = {}
+    layer_ids = {}
+    for name in sorted(doc.layers, key=lambda name: name.count('::')):
+        props = doc.layers[name]
+        layer = model_layers.get(name)
+        if layer is None:
+            layer = rhino3dm.Layer()
+            layer.Name = name.rsplit('::', 1)[-1]
+            if props.parent:
+                layer.ParentLayerId = layer_ids[props.parent]
+        layer.Color = tuple(props.color) + (255,)
+        layer.PlotColor = tuple(props.print_color) + (255,)
+        layer.PlotWeight = props.print_width
+        layer.Visible = props.visible
+        layer.Locked = props.locked
+        layer.LinetypeIndex = linetype_index.get(props.linetype, -1)
+        if name not in model_layers:
+            layer = model.Layers.FindIndex(model.Layers.Add(layer))
+        layer_index[name] = layer.Index
+        layer_ids[name] = layer.Id
+
+    model_groups = dict([(name, index) for index, name in source['groups'].items() if name is not None])
+    group_index = {}
+    for name in doc.groups:
+        if name in model_groups:
+            group_index[name] = model_groups[name]
+        else:
+            group = rhino3dm.Group()
+            group.Name = name
+            group_index[name] = len(model.Groups)
+            model.Groups.Add(group)
+
+    model_idefs = {}
+    for idef in model.InstanceDefinitions:
+        model_idefs[idef.Name] = idef
+
+    tables = {'layers': layer_index, 'linetypes': linetype_index, 'groups': group_index,
+              'originals': originals, 'idefs': {}, 'model_idefs': model_idefs, 'model': model}
+    for block_name in doc.blocks:
+        _save_definition(block_name, tables)
+
+    for obj in doc.objects.values():
+        if obj.idef is None:
+            geometry, attributes = _save_object(obj, tables)
+            if geometry is not None:
+                if obj.id in originals:
+                    model.Objects.Delete(attributes.Id)
+                model.Objects.Add(geometry, attributes)
+
+    # What the script deleted
+    for obj_id, (geometry, attributes, signature) in originals.items():
+        if obj_id not in doc.objects and not attributes.IsInstanceDefinitionObject:
+            model.Objects.Delete(attributes.Id)
+    for name, idef in model_idefs.items():
+        if name not in doc.blocks:
+            for object_id in idef.GetObjectIds():
+                model.Objects.Delete(object_id)
+    for name, index in model_groups.items():
+        if name not in doc.groups:
+            model.Groups.Delete(index)
+    for name, layer in model_layers.items():
+        if name not in doc.layers:
+            model.Layers.Delete(layer.Id)
+
+    if not model.Write(path, 0):
+        raise IOError('%s cannot be written' % path)
+
+
+def _save_definition(block_name, tables):
+    """
+    Add a block definition to the file, after the definitions nested in it, or update the attributes 
+    of the objects of a definition the file has. Returns its id.
+    """
+    if block_name in tables['idefs']:
+        return tables['idefs'][block_name]
+
+    doc = rs.document()
+    for member_id in doc.blocks[block_name]:
+        member = doc.objects[member_id]
+        if member.kind == 'instance':
+            _save_definition(member.block, tables)
+
+    idef = tables['model_idefs'].get(block_name)
+    if idef is not None:
+        for member_id in doc.blocks[block_name]:
+            _save_object(doc.objects[member_id], tables)
+        tables['idefs'][block_name] = idef.Id
+        return idef.Id
+
+    geometry_lst = []
+    attributes_lst = []
+    for member_id in doc.blocks[block_name]:
+        geometry, attributes = _save_object(doc.objects[member_id], tables)
+        if geometry is None:
+            geometry = tables['originals'][member_id][0]
+        geometry_lst.append(geometry)
+        attributes_lst.append(attributes)
+
+    model = tables['model']
+    index = model.InstanceDefinitions.Add(block_name, '', '', '', rhino3dm.Point3d(0, 0, 0),
+                                          tuple(geometry_lst), tuple(attributes_lst))
+    tables['idefs'][block_name] = model.InstanceDefinitions.FindIndex(index).Id
+    return tables['idefs'][block_name]
+
+
+def _save_object(obj, tables):
+    """
+    Returns the geometry and attributes to write for an in-memory object. The attributes of an object 
+    read from the file are those of the file, updated in place. Its geometry is None if the file's 
+    object is kept.
+    """
+    original = tables['originals'].get(obj.id)
+    if original is not None:
+        geometry, attributes, signature = original
+        # Objects the script changed are written from their points, but for those that cannot be rebuilt
+        changed = obj.kind != 'geometry' and signature != _signature(obj)
+    else:
+        attributes = rhino3dm.ObjectAttributes()
+        changed = True
+
+    if not changed:
+        geometry = None
+    elif obj.kind == 'instance':
+        geometry = rhino3dm.InstanceReference(tables['idefs'][obj.block], _xform_from_rows(obj.xform))
+    else:
+        pts = [rhino3dm.Point3d(pt.X, pt.Y, pt.Z) for pt in obj.points]
+        if obj.kind == 'curve' and len(pts) == 2:
+            geometry = rhino3dm.LineCurve(pts[0], pts[1])
+        elif obj.kind in ('curve', 'hatch') and len(pts) > 2:
+            geometry = rhino3dm.PolylineCurve(pts)
+        elif obj.kind == 'text':
+            geometry = rhino3dm.TextDot(obj.text or '', pts[0])
+        else:
+            geometry = rhino3dm.Point(pts[0])
+
+    attributes.LayerIndex = tables['layers'].get(obj.layer, 0)
+    attributes.ObjectColor = tuple(obj.color) + (255,)
+    attributes.ColorSource = rhino3dm.ObjectColorSource(obj.color_source)
+    attributes.PlotColor = tuple(obj.print_color) + (255,)
+    attributes.PlotColorSource = rhino3dm.ObjectPlotColorSource(obj.print_color_source)
+    attributes.PlotWeightSource = rhino3dm.ObjectPlotWeightSource(obj.print_width_source)
+    if obj.linetype:
+        attributes.LinetypeSource = rhino3dm.ObjectLinetypeSource.LinetypeFromObject
+        attributes.LinetypeIndex = tables['linetypes'].get(obj.linetype, -1)
+    else:
+        attributes.LinetypeSource = rhino3dm.ObjectLinetypeSource.LinetypeFromLayer
+    if obj.idef is None:
+        if obj.hidden:
+            attributes.Mode = rhino3dm.ObjectMode.Hidden
+        elif obj.locked:
+            attributes.Mode = rhino3dm.ObjectMode.Locked
+        else:
+            attributes.Mode = rhino3dm.ObjectMode.Normal
+
+    attributes.RemoveFromAllGroups()
+    for group_name in rs.ObjectGroups(obj.id):
+        attributes.AddToGroup(tables['groups'][group_name])
+
+    return geometry, attributes
+
+
+# ---------------------------------------------------------------------------
+# Batch
+# ---------------------------------------------------------------------------
+
+def process_file(task):
+    """
+    Run the definitions on one file. Called in the worker processes.
+
+    Arguments:
+    task -- (input path, output path, drawing name or None, operation names)
+
+    Returns:
+    A dictionary of the file's results, with the error if it failed
+    """
+    global _script
+    in_path, out_path, drawing_name, ops = task
+    result = {'file': os.path.basename(in_path), 'error': None}
+    start = time.time()
+
+    try:
+        if _script is None:
+            _script = load_script()
+        ph = _script
+
+        source = load_3dm(in_path)
+        result['objects'] = len(rs.AllObjects())
+
+        ph.DRAWING_NAME = drawing_name or os.path.splitext(os.path.basename(in_path))[0]
+        rs.AddLayer(ph.DRAWING_NAME)
+
+        for op in ops:
+            if op == 'organize_layers':
+                ph.organize_layers()
+            elif op == 'assign_standard_print':
+                ph.assign_standard_print(ph.DRAWING_NAME)
+            elif op == 'select_overlapping_lines':
+                overlapping = ph.select_overlapping_lines(sel_lines=rs.ObjectsByType(4)) or []
+                rs.UnselectAllObjects()
+                if overlapping:
+                    # A file processed before already has the group
+                    if not rs.IsGroup(OVERLAP_GROUP):
+                        rs.AddGroup(OVERLAP_GROUP)
+                    rs.AddObjectsToGroup(overlapping, OVERLAP_GROUP)
+                result['overlapping'] = len(overlapping)
+            elif op == 'purge_empty_layers':
+                ph.purge_empty_layers()
+
+        save_3dm(out_path, source)
+    except Exception:
+        result['error'] = traceback.format_exc()
+
+    result['seconds'] = time.time() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run PresentationHelper over a folder of .3dm files.')
+    parser.add_argument('input', help='folder of the .3dm files to process')
+    parser.add_argument('output', help='folder to write the processed files to')
+    parser.add_argument('--drawing-name', help='DRAWING_NAME for all files, instead of each file\'s name')
+    parser.add_argument('--ops', nargs='+', default=OPERATIONS, choices=OPERATIONS,
+                        help='definitions to run on each file, in order')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    if rhino3dm is None:
+        parser.error('rhino3dm is needed to read and write .3dm files: pip install rhino3dm')
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    if os.path.abspath(args.input) == os.path.abspath(args.output):
+        parser.error('the output folder must differ from the input folder')
+
+    tasks = [(os.path.join(args.input, name), os.path.join(args.output, name), args.drawing_name, args.ops)
+             for name in sorted(os.listdir(args.input)) if name.lower().endswith('.3dm')]
+    if not tasks:
+        print('No .3dm files in %s' % args.input)
+        return 0
+
+    start = time.time()
+    if args.workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(args.workers, len(tasks)))
+        try:
+            results = pool.imap_unordered(process_file, tasks, 1)
+            failed = _report(results)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        failed = _report(process_file(task) for task in tasks)
+
+    print('%d files in %.1f s, %d failed' % (len(tasks), time.time() - start, failed))
+    return 1 if failed else 0
+
+
+def _report(results):
+    """
+    Print each file's result as it finishes. Returns the number of files that failed.
+    """
+    failed = 0
+    for result in results:
+        if result['error']:
+            failed += 1
+            print('%s failed after %.1f s\n%s' % (result['file'], result['seconds'], result['error']))
+        else:
+            print('%s: %d objects, %s overlapping lines, %.1f s' % (
+                result['file'], result['objects'], result.get('overlapping', '-'), result['seconds']))
+        sys.stdout.flush()
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Time the WHAT_TO_DO operations of PresentationHelper on synthetic plans of growing size,
+with the in-memory rhinoscriptsyntax in this folder instead of Rhino.
+
+Usage:
+python benchmark.py [--sizes 1000 10000 100000] [--ops organize_layers select_overlapping_lines] [--repeat 1]
+
+For each operation and plan size the best time of the repeats is reported, followed by
+the growth exponent between consecutive sizes: about 1 for linear operations, 2 for quadratic ones.
+"""
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import rhinoscriptsyntax as rs
+import synthetic
+
+SCRIPT = os.path.join(os.path.dirname(HERE), 'PresentationHelper20190703.py')
+SUPERLINEAR = 1.5
+
+
+def load_script(path=SCRIPT):
+    """
+    Import the script as a module named ph, without running its __main__ block.
+    """
+    try:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location('ph', path)
+        module = importlib.util.module_from_spec(spec)
+        # Registered so that worker processes can find its functions, see _map_parallel()
+        sys.modules['ph'] = module
+        spec.loader.exec_module(module)
+        return module
+    except ImportError:
+        import imp
+        return imp.load_source('ph', path)
+
+
+def _op_find_blocks(ph, plan):
+    return lambda: ph.find_blocks()
+
+
+def _op_replace_dict(ph, plan):
+    return lambda: ph._make_block_replace_dict()
+
+
+def _op_replace_same_block(ph, plan):
+    replace_dict = ph._make_block_replace_dict()
+    return lambda: ph.replace_same_block(replace_dict)
+
+
+def _op_blocks_to_groups(ph, plan):
+    block_set = set(rs.ObjectsByType(4096))
+    return lambda: ph.blocks_to_groups(block_set)
+
+
+def _op_organize_layers(ph, plan):
+    return lambda: ph.organize_layers()
+
+
+def _op_extend_to_closest_group(ph, plan):
+    objs = []
+    for group in plan['groups']:
+        objs.extend(rs.ObjectsByGroup(group))
+    return lambda: ph.extend_to_closest_group(objs)
+
+
+def _op_extend_to_closest_group_x4(ph, plan):
+    objs = []
+    for group in plan['groups']:
+        objs.extend(rs.ObjectsByGroup(group))
+    return lambda: ph.extend_to_closest_group(objs, workers=4)
+
+
+def _op_select_overlapping_lines(ph, plan):
+    sel_lines = rs.ObjectsByType(4)
+    return lambda: ph.select_overlapping_lines(sel_lines=sel_lines)
+
+
+def _op_select_overlapping_lines_x4(ph, plan):
+    sel_lines = rs.ObjectsByType(4)
+    return lambda: ph.select_overlapping_lines(sel_lines=sel_lines, workers=4)
+
+
+def _op_purge_empty_layers(ph, plan):
+    ph.set_layers(ph.MARKETING_LINE_LAYERS)
+    return lambda: ph.purge_empty_layers()
+
+
+def _op_assign_standard_print(ph, plan):
+    ph.organize_layers()
+    return lambda: ph.assign_standard_print()
+
+
+def _op_print_frame_legends(ph, plan):
+    objs = rs.AllObjects()
+    # Large plans do not fit the scales set_print_frame() tries
+    bbox = rs.BoundingBox(objs)
+    scale = max(bbox[1][0] - bbox[0][0], bbox[2][1] - bbox[1][1])/7.5
+
+    def run():
+        frame_pt, scale_ = ph.set_print_frame(objs, frame_size=(11, 8.5), scale=scale)
+        ph.add_legends(scale_, frame_pt)
+    return run
+
+
+# Operation name: a function preparing the operation on a new plan and returning it to be timed
+OPERATIONS = [('find_blocks', _op_find_blocks),
+              ('_make_block_replace_dict', _op_replace_dict),
+              ('replace_same_block', _op_replace_same_block),
+              ('blocks_to_groups', _op_blocks_to_groups),
+              ('organize_layers', _op_organize_layers),
+              ('extend_to_closest_group', _op_extend_to_closest_group),
+              ('extend_to_closest_group_x4', _op_extend_to_closest_group_x4),
+              ('select_overlapping_lines', _op_select_overlapping_lines),
+              ('select_overlapping_lines_x4', _op_select_overlapping_lines_x4),
+              ('purge_empty_layers', _op_purge_empty_layers),
+              ('assign_standard_print', _op_assign_standard_print),
+              ('set_print_frame+add_legends', _op_print_frame_legends)]
+
+
+def time_operation(ph, prepare, size, repeat=1, seed=0):
+    """
+    Returns the best time[float] in seconds of an operation over repeat runs, each on a new plan.
+    """
+    best = None
+    for _ in range(repeat):
+        plan = synthetic.make_plan(size, seed)
+        rs.AddLayer(ph.DRAWING_NAME)
+        # A cold anchor cache on every run
+        if ph.ANCHOR_CACHE_FILE and os.path.exists(ph.ANCHOR_CACHE_FILE):
+            os.remove(ph.ANCHOR_CACHE_FILE)
+        run = prepare(ph, plan)
+        start = time.time()
+        run()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def growth_exponents(sizes, times):
+    """
+    Returns the exponent k of time ~ size**k between each pair of consecutive sizes.
+    """
+    exponents = []
+    for i in range(1, len(sizes)):
+        if times[i-1] > 0 and times[i] > 0:
+            exponents.append(math.log(times[i]/times[i-1])/math.log(float(sizes[i])/sizes[i-1]))
+        else:
+            exponents.append(None)
+    return exponents
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark PresentationHelper on synthetic plans.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='approximate object counts of the plans')
+    parser.add_argument('--ops', nargs='+', default=[name for name, _ in OPERATIONS],
+                        help='operations to time')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per operation and size, the best is reported')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the plan generator')
+    args = parser.parse_args(argv)
+
+    operations = dict(OPERATIONS)
+    unknown = [name for name in args.ops if name not in operations]
+    if unknown:
+        parser.error('unknown operations: %s' % ', '.join(unknown))
+
+    # Keep the anchor cache file away from the user's own
+    home = tempfile.mkdtemp()
+    os.environ['HOME'] = home
+    os.environ['USERPROFILE'] = home
+    try:
+        ph = load_script()
+        sizes = sorted(args.sizes)
+
+        header = '%-30s' % 'operation' + ''.join(['%12d' % size for size in sizes]) + '   growth'
+        print(header)
+        print('-'*len(header))
+        for name in args.ops:
+            times = [time_operation(ph, operations[name], size, args.repeat, args.seed) for size in sizes]
+            exponents = growth_exponents(sizes, times)
+            growth = ' '.join(['%.2f' % k if k is not None else '-' for k in exponents])
+            if [k for k in exponents if k is not None and k > SUPERLINEAR]:
+                growth += '  superlinear'
+            print('%-30s' % name + ''.join(['%11.3fs' % t for t in times]) + '   ' + growth)
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1420 @@
+"""
+In-memory stand-in for the subset of rhinoscriptsyntax used by PresentationHelper.
+
+The document lives in module state (see reset()). Curves are kept as lists of
+vertices, so lines, polylines and sampled circles are supported; hatches, text,
+points, groups, layers and (nested) block definitions are supported as far as
+the presentation helper needs them. Nothing here talks to Rhino.
+"""
+import math
+import uuid
+from collections import OrderedDict
+
+
+ABSOLUTE_TOLERANCE = 0.001
+ANGLE_TOLERANCE = math.pi / 180.0
+
+CURVE = 4
+POINT = 1
+ANNOTATION = 512
+INSTANCE = 4096
+HATCH = 65536
+
+
+class Point3d(object):
+    """
+    A small, immutable stand-in for Rhino.Geometry.Point3d/Vector3d.
+    """
+    __slots__ = ('X', 'Y', 'Z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.X = float(x)
+        self.Y = float(y)
+        self.Z = float(z)
+
+    def __getitem__(self, i):
+        return (self.X, self.Y, self.Z)[i]
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return iter((self.X, self.Y, self.Z))
+
+    def __add__(self, other):
+        other = coerce3dpoint(other)
+        return Point3d(self.X + other.X, self.Y + other.Y, self.Z + other.Z)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other = coerce3dpoint(other)
+        return Point3d(self.X - other.X, self.Y - other.Y, self.Z - other.Z)
+
+    def __rsub__(self, other):
+        return coerce3dpoint(other) - self
+
+    def __mul__(self, factor):
+        return Point3d(self.X * factor, self.Y * factor, self.Z * factor)
+
+    __rmul__ = __mul__
+
+    def __div__(self, factor):
+        return Point3d(self.X / factor, self.Y / factor, self.Z / factor)
+
+    __truediv__ = __div__
+
+    def __neg__(self):
+        return Point3d(-self.X, -self.Y, -self.Z)
+
+    def __eq__(self, other):
+        try:
+            other = coerce3dpoint(other)
+        except (TypeError, ValueError):
+            return False
+        return self.X == other.X and self.Y == other.Y and self.Z == other.Z
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.X, self.Y, self.Z))
+
+    def __repr__(self):
+        return 'Point3d(%r, %r, %r)' % (self.X, self.Y, self.Z)
+
+
+Vector3d = Point3d
+
+
+class Color(tuple):
+    """
+    A stand-in for System.Drawing.Color that also behaves like an RGB tuple.
+    """
+    def __new__(cls, r, g, b):
+        return tuple.__new__(cls, (int(r), int(g), int(b)))
+
+    R = property(lambda self: self[0])
+    G = property(lambda self: self[1])
+    B = property(lambda self: self[2])
+
+
+class Plane(object):
+    def __init__(self, origin, x_axis, y_axis):
+        self.Origin = origin
+        self.XAxis = x_axis
+        self.YAxis = y_axis
+
+
+class PolylineCurve(object):
+    """
+    Result of _CurveGeometry.ToPolyline(), exposing the RhinoCommon members used.
+    """
+    def __init__(self, points):
+        self._points = list(points)
+        self.PointCount = len(self._points)
+
+    def Point(self, index):
+        return self._points[index]
+
+
+class _CurveGeometry(object):
+    """
+    Returned by coercecurve(); supports the ToPolyline() overload used by the helper.
+    """
+    def __init__(self, points):
+        self._points = list(points)
+
+    def ToPolyline(self, *args):
+        return PolylineCurve(self._points)
+
+
+class _Layer(object):
+    __slots__ = ('name', 'parent', 'color', 'print_color', 'print_width',
+                 'visible', 'locked', 'linetype')
+
+    def __init__(self, name, parent, color):
+        self.name = name
+        self.parent = parent
+        self.color = color
+        self.print_color = Color(0, 0, 0)
+        self.print_width = 0.0
+        self.visible = True
+        self.locked = False
+        self.linetype = 'Continuous'
+
+
+class _Obj(object):
+    __slots__ = ('id', 'kind', 'layer', 'color', 'print_color', 'print_width', 'color_source',
+                 'print_color_source', 'print_width_source', 'linetype',
+                 'points', 'closed', 'text', 'height', 'block', 'xform',
+                 'idef', 'hidden', 'locked', 'selected', 'type_code')
+
+    def __init__(self, kind, layer, points=None):
+        self.id = None
+        self.kind = kind
+        self.layer = layer
+        self.color = Color(0, 0, 0)
+        self.print_color = Color(0, 0, 0)
+        self.print_width = 0.0
+        self.color_source = 0
+        self.print_color_source = 0
+        self.print_width_source = 0
+        self.linetype = None
+        self.points = points or []
+        self.closed = False
+        self.text = None
+        self.height = 1.0
+        self.block = None
+        self.xform = None
+        self.idef = None
+        self.hidden = False
+        self.locked = False
+        self.selected = False
+        self.type_code = None
+
+    def copy(self):
+        new = _Obj(self.kind, self.layer, list(self.points))
+        for attr in _Obj.__slots__:
+            if attr not in ('id', 'points', 'selected', 'idef'):
+                setattr(new, attr, getattr(self, attr))
+        return new
+
+
+class _Document(object):
+    def __init__(self):
+        self.objects = OrderedDict()
+        self.layers = OrderedDict()
+        self.blocks = OrderedDict()
+        self.groups = OrderedDict()
+        self.object_groups = {}
+        self.current_layer = None
+        self.redraw = True
+        self.next_id = 1
+        self.undo_serial = 0
+        self.undo_records = []
+        self.path = None
+
+
+_doc = None
+_picks = {}
+
+
+def reset():
+    """
+    Start a new empty document with the 'Default' layer as current layer.
+    """
+    global _doc
+    _doc = _Document()
+    _picks.clear()
+    AddLayer('Default')
+    _doc.current_layer = 'Default'
+    return _doc
+
+
+def document():
+    return _doc
+
+
+def set_pick(kind, value):
+    """
+    Provide the answer to the next interactive Get*() call of the given kind
+    ('object', 'objects' or 'point'), since there is no user to ask.
+    """
+    _picks[kind] = value
+
+
+def add_object(kind, points, type_code=None):
+    """
+    Add an object on the current layer that has no rhinoscriptsyntax constructor here,
+    such as a hatch read from a file ('hatch') or a surface or mesh ('geometry').
+    The points give the extent of the object; type_code is what ObjectType() returns
+    for it, if it differs from the one of the kind.
+    """
+    obj = _new(kind, points)
+    obj.type_code = type_code
+    return _add(obj)
+
+
+# ---------------------------------------------------------------------------
+# Coercion helpers
+# ---------------------------------------------------------------------------
+
+def coerce3dpoint(point, raise_on_error=False):
+    if isinstance(point, Point3d):
+        return point
+    if isinstance(point, uuid.UUID):
+        obj = _get(point)
+        if obj.kind == 'point':
+            return obj.points[0]
+    try:
+        if len(point) == 3:
+            return Point3d(point[0], point[1], point[2])
+        if len(point) == 2:
+            return Point3d(point[0], point[1], 0.0)
+    except TypeError:
+        pass
+    if raise_on_error:
+        raise TypeError('%r can not be converted to a Point3d' % (point,))
+    return None
+
+
+coerce3dvector = coerce3dpoint
+
+
+def coerceguid(obj_id):
+    if isinstance(obj_id, uuid.UUID):
+        return obj_id
+    if isinstance(obj_id, str):
+        return uuid.UUID(obj_id)
+    return None
+
+
+def coercecurve(curve_id, segment_index=-1, raise_if_missing=False):
+    obj = _doc.objects.get(coerceguid(curve_id))
+    if obj is None or obj.kind != 'curve':
+        if raise_if_missing:
+            raise ValueError('%r is not a curve' % (curve_id,))
+        return None
+    return _CurveGeometry(obj.points)
+
+
+def coercecolor(color):
+    if color is None:
+        return None
+    try:
+        return Color(color[0], color[1], color[2])
+    except (TypeError, KeyError, IndexError):
+        return None
+
+
+def _ids(object_ids):
+    guid = coerceguid(object_ids)
+    if guid is not None:
+        return [guid]
+    if object_ids is None:
+        return []
+    return [coerceguid(i) for i in object_ids]
+
+
+def _get(obj_id):
+    return _doc.objects[coerceguid(obj_id)]
+
+
+def _find(obj_id):
+    guid = coerceguid(obj_id)
+    if guid is None:
+        return None
+    return _doc.objects.get(guid)
+
+
+def _add(obj):
+    obj.id = uuid.UUID(int=_doc.next_id)
+    _doc.next_id += 1
+    _doc.objects[obj.id] = obj
+    return obj.id
+
+
+def _doc_objects():
+    for obj in _doc.objects.values():
+        if obj.idef is None:
+            yield obj
+
+
+def _layer_selectable(layer_name):
+    while layer_name:
+        layer = _doc.layers[layer_name]
+        if not layer.visible or layer.locked:
+            return False
+        layer_name = layer.parent
+    return True
+
+
+def _selectable(obj):
+    return not obj.hidden and not obj.locked and _layer_selectable(obj.layer)
+
+
+# ---------------------------------------------------------------------------
+# Transforms
+# ---------------------------------------------------------------------------
+
+def XformIdentity():
+    return [[1.0 if i == j else 0.0 for j in range(4)] for i in range(4)]
+
+
+def XformTranslation(vector):
+    vector = coerce3dpoint(vector)
+    xform = XformIdentity()
+    xform[0][3], xform[1][3], xform[2][3] = vector.X, vector.Y, vector.Z
+    return xform
+
+
+def XformRotation2(angle_degrees, rotation_axis, center_point):
+    """
+    Rotation about the world Z axis through center_point (the only axis used here).
+    """
+    angle = math.radians(angle_degrees)
+    c, s = math.cos(angle), math.sin(angle)
+    center = coerce3dpoint(center_point)
+    rotation = [[c, -s, 0.0, 0.0], [s, c, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0], [0.0, 0.0, 0.0, 1.0]]
+    return XformMultiply(XformTranslation(center), XformMultiply(rotation, XformTranslation(-center)))
+
+
+def XformMirror(mirror_plane_point, mirror_plane_normal):
+    """
+    Mirror across the plane through the point with a normal in the XY plane.
+    """
+    normal = coerce3dpoint(mirror_plane_normal)
+    length = math.sqrt(normal.X ** 2 + normal.Y ** 2 + normal.Z ** 2)
+    nx, ny, nz = normal.X / length, normal.Y / length, normal.Z / length
+    mirror = [[1 - 2 * nx * nx, -2 * nx * ny, -2 * nx * nz, 0.0],
+              [-2 * nx * ny, 1 - 2 * ny * ny, -2 * ny * nz, 0.0],
+              [-2 * nx * nz, -2 * ny * nz, 1 - 2 * nz * nz, 0.0],
+              [0.0, 0.0, 0.0, 1.0]]
+    point = coerce3dpoint(mirror_plane_point)
+    return XformMultiply(XformTranslation(point), XformMultiply(mirror, XformTranslation(-point)))
+
+
+def XformMultiply(xform1, xform2):
+    return [[sum(xform1[i][k] * xform2[k][j] for k in range(4)) for j in range(4)] for i in range(4)]
+
+
+def XformInverse(xform):
+    """
+    Inverse of an affine transform.
+    """
+    a = [row[:3] for row in xform[:3]]
+    det = (a[0][0] * (a[1][1] * a[2][2] - a[1][2] * a[2][1])
+           - a[0][1] * (a[1][0] * a[2][2] - a[1][2] * a[2][0])
+           + a[0][2] * (a[1][0] * a[2][1] - a[1][1] * a[2][0]))
+    if not det:
+        return None
+    inv = [[0.0] * 3 for _ in range(3)]
+    for i in range(3):
+        for j in range(3):
+            minor = [[a[r][c] for c in range(3) if c != i] for r in range(3) if r != j]
+            cofactor = minor[0][0] * minor[1][1] - minor[0][1] * minor[1][0]
+            inv[i][j] = (-1) ** (i + j) * cofactor / det
+    translation = [xform[i][3] for i in range(3)]
+    result = XformIdentity()
+    for i in range(3):
+        for j in range(3):
+            result[i][j] = inv[i][j]
+        result[i][3] = -sum(inv[i][k] * translation[k] for k in range(3))
+    return result
+
+
+def _apply(xform, point):
+    x, y, z = point.X, point.Y, point.Z
+    return Point3d(xform[0][0] * x + xform[0][1] * y + xform[0][2] * z + xform[0][3],
+                   xform[1][0] * x + xform[1][1] * y + xform[1][2] * z + xform[1][3],
+                   xform[2][0] * x + xform[2][1] * y + xform[2][2] * z + xform[2][3])
+
+
+def _transform_obj(obj, xform):
+    obj.points = [_apply(xform, pt) for pt in obj.points]
+    if obj.kind == 'instance':
+        obj.xform = XformMultiply(xform, obj.xform)
+
+
+def TransformObject(object_id, matrix, copy=False):
+    result = TransformObjects([object_id], matrix, copy)
+    return result[0] if result else None
+
+
+def TransformObjects(object_ids, matrix, copy=False):
+    result = []
+    for obj_id in _ids(object_ids):
+        obj = _get(obj_id)
+        if copy:
+            obj = obj.copy()
+            _add(obj)
+            # Copies are in the groups of the objects copied, as in Rhino
+            for group_name in _doc.object_groups.get(obj_id, []):
+                AddObjectToGroup(obj.id, group_name)
+        _transform_obj(obj, matrix)
+        result.append(obj.id)
+    return result
+
+
+def MoveObject(object_id, translation):
+    return TransformObject(object_id, XformTranslation(translation))
+
+
+def CopyObject(object_id, translation=None):
+    return TransformObject(object_id, XformTranslation(translation or (0, 0, 0)), True)
+
+
+# ---------------------------------------------------------------------------
+# Document, redraw, selection
+# ---------------------------------------------------------------------------
+
+def EnableRedraw(enable=True):
+    old = _doc.redraw
+    _doc.redraw = enable
+    return old
+
+
+def Redraw():
+    pass
+
+
+def UnitAbsoluteTolerance(tolerance=None, in_model_units=True):
+    return ABSOLUTE_TOLERANCE
+
+
+def DocumentPath():
+    return _doc.path
+
+
+def Command(command_string, echo=True):
+    kinds = {'SelText': ('text',), 'SelCrv': ('curve',), 'SelHatch': ('hatch',),
+             'SelBlockInstance': ('instance',), 'SelAll': None}
+    command = command_string.strip().lstrip('_')
+    if command not in kinds:
+        return False
+    wanted = kinds[command]
+    for obj in _doc_objects():
+        if (wanted is None or obj.kind in wanted) and _selectable(obj):
+            obj.selected = True
+    return True
+
+
+def SelectObjects(object_ids):
+    count = 0
+    for obj_id in _ids(object_ids):
+        _get(obj_id).selected = True
+        count += 1
+    return count
+
+
+def SelectObject(object_id):
+    return SelectObjects([object_id]) == 1
+
+
+def UnselectAllObjects():
+    count = 0
+    for obj in _doc_objects():
+        if obj.selected:
+            obj.selected = False
+            count += 1
+    return count
+
+
+def SelectedObjects(include_lights=False, include_grips=False):
+    return [obj.id for obj in _doc_objects() if obj.selected]
+
+
+def AllObjects(select=False, include_lights=False, include_grips=False, include_references=False):
+    return [obj.id for obj in _doc_objects()]
+
+
+def NormalObjects(include_lights=False, include_grips=False):
+    return [obj.id for obj in _doc_objects() if not obj.hidden and not obj.locked]
+
+
+def _filter_match(obj, filter):
+    if not filter:
+        return True
+    if obj.type_code is not None:
+        return bool(obj.type_code & filter)
+    codes = {'curve': CURVE, 'point': POINT, 'text': ANNOTATION, 'instance': INSTANCE, 'hatch': HATCH}
+    return bool(codes[obj.kind] & filter)
+
+
+def GetObjects(message=None, filter=0, group=True, preselect=False, select=False, objects=None,
+               minimum_count=1, maximum_count=0, custom_filter=None):
+    if 'objects' in _picks:
+        picked = _picks.pop('objects')
+    elif preselect:
+        picked = SelectedObjects()
+    else:
+        picked = None
+    if not picked:
+        return None
+    picked = [obj_id for obj_id in picked if _filter_match(_get(obj_id), filter)]
+    return picked or None
+
+
+def GetObject(message=None, filter=0, preselect=False, select=False, custom_filter=None, subobjects=False):
+    if 'object' in _picks:
+        return _picks.pop('object')
+    picked = GetObjects(message, filter, preselect=preselect)
+    return picked[0] if picked else None
+
+
+def GetPoint(message=None, base_point=None, distance=None, in_plane=False):
+    point = _picks.pop('point', None)
+    if point is None:
+        raise RuntimeError('GetPoint() needs an answer, see set_pick()')
+    return coerce3dpoint(point)
+
+
+def DeleteObject(object_id):
+    return DeleteObjects([object_id]) == 1
+
+
+def DeleteObjects(object_ids):
+    count = 0
+    for obj_id in _ids(object_ids):
+        obj = _doc.objects.pop(obj_id, None)
+        if obj is not None:
+            for group_name in _doc.object_groups.pop(obj_id, ()):
+                del _doc.groups[group_name][obj_id]
+            count += 1
+    return count
+
+
+def IsObject(object_id):
+    return _find(object_id) is not None
+
+
+def ObjectType(object_id):
+    obj = _get(object_id)
+    if obj.type_code is not None:
+        return obj.type_code
+    codes = {'curve': CURVE, 'point': POINT, 'text': ANNOTATION, 'instance': INSTANCE, 'hatch': HATCH}
+    return codes[obj.kind]
+
+
+def ObjectsByType(geometry_type, select=False, state=0):
+    return [obj.id for obj in _doc_objects() if _filter_match(obj, geometry_type)]
+
+
+def IsObjectHidden(object_id):
+    return _get(object_id).hidden
+
+
+def IsObjectLocked(object_id):
+    return _get(object_id).locked
+
+
+# ---------------------------------------------------------------------------
+# Object attributes
+# ---------------------------------------------------------------------------
+
+def MatchObjectAttributes(target_ids, source_id=None):
+    source = _get(source_id) if source_id else _Obj('curve', _doc.current_layer)
+    count = 0
+    for obj_id in _ids(target_ids):
+        obj = _get(obj_id)
+        for attr in ('layer', 'color', 'print_color', 'color_source', 'print_color_source',
+                     'print_width_source', 'linetype'):
+            setattr(obj, attr, getattr(source, attr))
+        count += 1
+    return count
+
+
+def ObjectLayer(object_id, layer=None):
+    if layer is not None and layer not in _doc.layers:
+        raise ValueError('layer %r does not exist' % layer)
+    if coerceguid(object_id) is not None:
+        obj = _get(object_id)
+        old = obj.layer
+        if layer is not None:
+            obj.layer = layer
+        return old
+    ids = _ids(object_id)
+    for obj_id in ids:
+        _get(obj_id).layer = layer
+    return len(ids)
+
+
+def _draw_color(obj):
+    if obj.color_source == 1:
+        return obj.color
+    return _doc.layers[obj.layer].color
+
+
+def ObjectColor(object_ids, color=None):
+    ids = _ids(object_ids)
+    old = _draw_color(_get(ids[0])) if ids else None
+    if color is not None:
+        color = coercecolor(color)
+        for obj_id in ids:
+            obj = _get(obj_id)
+            obj.color = color
+            obj.color_source = 1
+        if coerceguid(object_ids) is None:
+            return len(ids)
+    return old
+
+
+def ObjectPrintColor(object_ids, color=None):
+    ids = _ids(object_ids)
+    old = _get(ids[0]).print_color if ids else None
+    if color is not None:
+        for obj_id in ids:
+            obj = _get(obj_id)
+            obj.print_color = coercecolor(color)
+            obj.print_color_source = 1
+    return old
+
+
+def _source_setter(attr):
+    def setter(object_ids, source=None):
+        ids = _ids(object_ids)
+        old = getattr(_get(ids[0]), attr) if ids else None
+        if source is not None:
+            for obj_id in ids:
+                setattr(_get(obj_id), attr, source)
+            if coerceguid(object_ids) is None:
+                return len(ids)
+        return old
+    return setter
+
+
+def ObjectPrintWidth(object_ids, width=None):
+    ids = _ids(object_ids)
+    old = _get(ids[0]).print_width if ids else None
+    if width is not None:
+        for obj_id in ids:
+            obj = _get(obj_id)
+            obj.print_width = width
+            obj.print_width_source = 1
+    return old
+
+
+ObjectColorSource = _source_setter('color_source')
+ObjectPrintColorSource = _source_setter('print_color_source')
+ObjectPrintWidthSource = _source_setter('print_width_source')
+
+
+def ObjectLinetype(object_ids, linetype=None):
+    ids = _ids(object_ids)
+    obj = _get(ids[0])
+    old = obj.linetype or _doc.layers[obj.layer].linetype
+    if linetype is not None:
+        for obj_id in ids:
+            _get(obj_id).linetype = linetype
+    return old
+
+
+def ObjectLinetypeSource(object_ids, source=None):
+    ids = _ids(object_ids)
+    old = 1 if _get(ids[0]).linetype else 0
+    if source == 0:
+        for obj_id in ids:
+            _get(obj_id).linetype = None
+    return old
+
+
+def ObjectsByColor(color, select=False, include_lights=False):
+    color = coercecolor(color)
+    return [obj.id for obj in _doc_objects() if _draw_color(obj) == color]
+
+
+def ObjectsByLayer(layer_name, select=False):
+    return [obj.id for obj in _doc_objects() if obj.layer == layer_name]
+
+
+def HideObjects(object_ids):
+    for obj_id in _ids(object_ids):
+        _get(obj_id).hidden = True
+
+
+def LockObjects(object_ids):
+    for obj_id in _ids(object_ids):
+        _get(obj_id).locked = True
+
+
+# ---------------------------------------------------------------------------
+# Layers
+# ---------------------------------------------------------------------------
+
+def AddLayer(name=None, color=None, visible=True, locked=False, parent=None):
+    names = name.split('::')
+    full = parent
+    for part in names:
+        full = part if not full else full + '::' + part
+        if full not in _doc.layers:
+            layer = _Layer(full, full.rsplit('::', 1)[0] if '::' in full else None,
+                           coercecolor(color) or Color(0, 0, 0))
+            layer.visible = visible
+            layer.locked = locked
+            _doc.layers[full] = layer
+    return full
+
+
+def _layer(name):
+    if name not in _doc.layers:
+        raise ValueError('layer %r does not exist' % name)
+    return _doc.layers[name]
+
+
+def IsLayer(layer):
+    return layer in _doc.layers
+
+
+def LayerNames(sort=False):
+    names = list(_doc.layers)
+    if sort:
+        names.sort()
+    return names
+
+
+def ParentLayer(layer, parent=None):
+    return _layer(layer).parent
+
+
+def LayerChildren(layer):
+    return [name for name, props in _doc.layers.items() if props.parent == layer]
+
+
+def LayerChildCount(layer):
+    return len(LayerChildren(layer))
+
+
+def _layer_property(attr, convert=None):
+    def accessor(layer, value=None):
+        props = _layer(layer)
+        old = getattr(props, attr)
+        if value is not None:
+            setattr(props, attr, convert(value) if convert else value)
+        return old
+    return accessor
+
+
+LayerColor = _layer_property('color', coercecolor)
+LayerPrintColor = _layer_property('print_color', coercecolor)
+LayerPrintWidth = _layer_property('print_width', float)
+LayerVisible = _layer_property('visible')
+LayerLocked = _layer_property('locked')
+LayerLinetype = _layer_property('linetype')
+
+
+def IsLayerVisible(layer):
+    return _layer(layer).visible
+
+
+def IsLayerLocked(layer):
+    return _layer(layer).locked
+
+
+def IsLayerEmpty(layer):
+    _layer(layer)
+    for obj in _doc.objects.values():
+        if obj.layer == layer:
+            return False
+    return True
+
+
+def CurrentLayer(layer=None):
+    old = _doc.current_layer
+    if layer is not None:
+        _layer(layer)
+        _doc.current_layer = layer
+    return old
+
+
+def DeleteLayer(layer):
+    if layer not in _doc.layers:
+        return False
+    subtree = [name for name in _doc.layers if name == layer or name.startswith(layer + '::')]
+    if _doc.current_layer in subtree:
+        return False
+    for obj in _doc.objects.values():
+        if obj.layer in subtree:
+            return False
+    for name in subtree:
+        del _doc.layers[name]
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Groups
+# ---------------------------------------------------------------------------
+
+def AddGroup(group_name=None):
+    if group_name is None:
+        group_name = 'Group%02d' % (len(_doc.groups) + 1)
+        while group_name in _doc.groups:
+            group_name += '_'
+    elif group_name in _doc.groups:
+        return None
+    _doc.groups[group_name] = OrderedDict()
+    return group_name
+
+
+def IsGroup(group_name):
+    return group_name in _doc.groups
+
+
+def AddObjectsToGroup(object_ids, group_name):
+    members = _doc.groups[group_name]
+    count = 0
+    for obj_id in _ids(object_ids):
+        if obj_id not in members:
+            members[obj_id] = None
+            _doc.object_groups.setdefault(obj_id, []).append(group_name)
+        count += 1
+    return count
+
+
+def AddObjectToGroup(object_id, group_name):
+    return AddObjectsToGroup([object_id], group_name) == 1
+
+
+def RemoveObjectFromAllGroups(object_id):
+    obj_id = coerceguid(object_id)
+    group_names = _doc.object_groups.pop(obj_id, [])
+    for group_name in group_names:
+        del _doc.groups[group_name][obj_id]
+    return bool(group_names)
+
+
+def ObjectsByGroup(group_name, select=False):
+    members = list(_doc.groups.get(group_name, []))
+    if select:
+        SelectObjects(members)
+    return members
+
+
+def ObjectGroups(object_id):
+    obj_id = coerceguid(object_id)
+    return list(_doc.object_groups.get(obj_id, []))
+
+
+# ---------------------------------------------------------------------------
+# Geometry creation
+# ---------------------------------------------------------------------------
+
+def _new(kind, points, layer=None):
+    return _Obj(kind, layer or _doc.current_layer, [coerce3dpoint(pt) for pt in points])
+
+
+def AddPoint(point):
+    return _add(_new('point', [point]))
+
+
+def AddLine(start, end):
+    return _add(_new('curve', [start, end]))
+
+
+def AddPolyline(points, replace_id=None):
+    obj = _new('curve', points)
+    obj.closed = obj.points[0] == obj.points[-1] and len(obj.points) > 2
+    return _add(obj)
+
+
+def AddCircle(plane_or_center, radius, segments=32):
+    center = coerce3dpoint(plane_or_center)
+    points = [center + (radius * math.cos(2 * math.pi * i / segments),
+                        radius * math.sin(2 * math.pi * i / segments), 0)
+              for i in range(segments)]
+    points.append(points[0])
+    obj = _new('curve', points)
+    obj.closed = True
+    obj.text = 'circle'
+    return _add(obj)
+
+
+def WorldXYPlane():
+    return Plane(Point3d(0, 0, 0), Point3d(1, 0, 0), Point3d(0, 1, 0))
+
+
+def AddRectangle(plane, width, height):
+    origin = plane.Origin
+    points = [origin, origin + plane.XAxis * width, origin + plane.XAxis * width + plane.YAxis * height,
+              origin + plane.YAxis * height, origin]
+    return AddPolyline(points)
+
+
+def AddText(text, point_or_plane, height=1.0, font=None, font_style=0, justification=None):
+    obj = _new('text', [point_or_plane])
+    obj.text = text
+    obj.height = height
+    return _add(obj)
+
+
+def AddHatch(curve_id, hatch_pattern=None, scale=1.0, rotation=0.0):
+    obj = _new('hatch', _get(curve_id).points)
+    obj.text = hatch_pattern
+    return _add(obj)
+
+
+def ExplodeCurves(curve_ids, delete_input=False):
+    result = []
+    for curve_id in _ids(curve_ids):
+        curve = _get(curve_id)
+        if len(curve.points) <= 2:
+            continue
+        for i in range(len(curve.points) - 1):
+            line = curve.copy()
+            line.points = [curve.points[i], curve.points[i + 1]]
+            line.closed = False
+            line.text = None
+            result.append(_add(line))
+        if delete_input:
+            DeleteObject(curve_id)
+    return result
+
+
+def ConvertCurveToPolyline(curve_id, angle_tolerance=5.0, tolerance=0.01, delete_input=False,
+                           min_edge_length=0, max_edge_length=0):
+    curve = _get(curve_id)
+    polyline = curve.copy()
+    polyline.text = None
+    new_id = _add(polyline)
+    if delete_input:
+        DeleteObject(curve_id)
+    return new_id
+
+
+def JoinCurves(object_ids, delete_input=False, tolerance=None):
+    tolerance = tolerance or ABSOLUTE_TOLERANCE * 2.1
+    pieces = [list(_get(obj_id).points) for obj_id in _ids(object_ids)]
+    layer = _get(_ids(object_ids)[0]).layer
+    joined = []
+    while pieces:
+        chain = pieces.pop(0)
+        grown = True
+        while grown:
+            grown = False
+            for i, piece in enumerate(pieces):
+                if Distance(chain[-1], piece[0]) <= tolerance:
+                    chain.extend(piece[1:])
+                elif Distance(chain[-1], piece[-1]) <= tolerance:
+                    chain.extend(piece[-2::-1])
+                elif Distance(chain[0], piece[-1]) <= tolerance:
+                    chain[:0] = piece[:-1]
+                elif Distance(chain[0], piece[0]) <= tolerance:
+                    chain[:0] = piece[:0:-1]
+                else:
+                    continue
+                pieces.pop(i)
+                grown = True
+                break
+        joined.append(chain)
+    result = []
+    for chain in joined:
+        obj = _new('curve', chain, layer)
+        obj.closed = len(chain) > 2 and Distance(chain[0], chain[-1]) <= tolerance
+        result.append(_add(obj))
+    if delete_input:
+        DeleteObjects(object_ids)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Curve queries
+# ---------------------------------------------------------------------------
+
+def _curve(curve_id):
+    obj = _get(curve_id)
+    if obj.kind != 'curve':
+        raise ValueError('%r is not a curve' % (curve_id,))
+    return obj
+
+
+def IsCurve(object_id):
+    obj = _find(object_id)
+    return obj is not None and obj.kind == 'curve'
+
+
+def IsLine(object_id, segment_index=-1):
+    obj = _find(object_id)
+    return obj is not None and obj.kind == 'curve' and len(obj.points) == 2
+
+
+def IsPolyline(object_id, segment_index=-1):
+    obj = _find(object_id)
+    return obj is not None and obj.kind == 'curve' and len(obj.points) > 2 and obj.text != 'circle'
+
+
+def IsCurveClosed(object_id):
+    return _curve(object_id).closed
+
+
+def IsText(object_id):
+    obj = _find(object_id)
+    return obj is not None and obj.kind == 'text'
+
+
+def IsHatch(object_id):
+    obj = _find(object_id)
+    return obj is not None and obj.kind == 'hatch'
+
+
+def IsPoint(object_id):
+    obj = _find(object_id)
+    return obj is not None and obj.kind == 'point'
+
+
+def CurveStartPoint(curve_id, segment_index=-1, point=None):
+    return _curve(curve_id).points[0]
+
+
+def CurveEndPoint(curve_id, segment_index=-1):
+    return _curve(curve_id).points[-1]
+
+
+def PolylineVertices(curve_id, segment_index=-1):
+    return list(_curve(curve_id).points)
+
+
+def CurvePoints(curve_id, segment_index=-1):
+    return list(_curve(curve_id).points)
+
+
+def DivideCurve(curve_id, segments, create_points=False, return_points=True):
+    points = _curve(curve_id).points
+    lengths = [Distance(points[i], points[i + 1]) for i in range(len(points) - 1)]
+    total = sum(lengths)
+    result = [points[0]]
+    for step in range(1, segments):
+        target = total * step / float(segments)
+        walked = 0.0
+        for i, length in enumerate(lengths):
+            if walked + length >= target and length:
+                t = (target - walked) / length
+                result.append(points[i] + (points[i + 1] - points[i]) * t)
+                break
+            walked += length
+    result.append(points[-1])
+    return result
+
+
+def Distance(point1, point2):
+    p1 = coerce3dpoint(point1)
+    p2 = coerce3dpoint(point2)
+    return math.sqrt((p1.X - p2.X) ** 2 + (p1.Y - p2.Y) ** 2 + (p1.Z - p2.Z) ** 2)
+
+
+def _closest_param(start, end, point):
+    dx, dy, dz = end.X - start.X, end.Y - start.Y, end.Z - start.Z
+    length_sq = dx * dx + dy * dy + dz * dz
+    if not length_sq:
+        return 0.0
+    t = ((point.X - start.X) * dx + (point.Y - start.Y) * dy + (point.Z - start.Z) * dz) / length_sq
+    return min(1.0, max(0.0, t))
+
+
+def _segment_distance(start, end, point):
+    t = _closest_param(start, end, point)
+    return Distance(start + (end - start) * t, point)
+
+
+def LineMinDistanceTo(line, point_or_line):
+    start, end = coerce3dpoint(line[0]), coerce3dpoint(line[1])
+    return _segment_distance(start, end, coerce3dpoint(point_or_line))
+
+
+def IsPointOnCurve(curve_id, point, segment_index=-1):
+    points = _curve(curve_id).points
+    point = coerce3dpoint(point)
+    for i in range(len(points) - 1):
+        if _segment_distance(points[i], points[i + 1], point) <= ABSOLUTE_TOLERANCE:
+            return True
+    return False
+
+
+def _cross(a, b):
+    return Point3d(a.Y * b.Z - a.Z * b.Y, a.Z * b.X - a.X * b.Z, a.X * b.Y - a.Y * b.X)
+
+
+def _dot(a, b):
+    return a.X * b.X + a.Y * b.Y + a.Z * b.Z
+
+
+def _length(v):
+    return math.sqrt(_dot(v, v))
+
+
+def VectorCreate(to_point, from_point):
+    return coerce3dpoint(to_point) - coerce3dpoint(from_point)
+
+
+def IsVectorParallelTo(vector1, vector2):
+    v1, v2 = coerce3dpoint(vector1), coerce3dpoint(vector2)
+    l1, l2 = _length(v1), _length(v2)
+    if not l1 or not l2:
+        return 0
+    cos = _dot(v1, v2) / (l1 * l2)
+    if cos >= math.cos(ANGLE_TOLERANCE):
+        return 1
+    if cos <= -math.cos(ANGLE_TOLERANCE):
+        return -1
+    return 0
+
+
+def _line_line(a0, a1, b0, b1):
+    """
+    Parameters of the closest points of two infinite lines, or None if parallel.
+    """
+    u, v, w = a1 - a0, b1 - b0, a0 - b0
+    a, b, c, d, e = _dot(u, u), _dot(u, v), _dot(v, v), _dot(u, w), _dot(v, w)
+    denom = a * c - b * b
+    if a == 0 or c == 0 or abs(denom) <= 1e-12 * a * c:
+        return None
+    return (b * e - c * d) / denom, (a * e - b * d) / denom
+
+
+def LineLineIntersection(lineA, lineB, planar=True):
+    a0, a1 = coerce3dpoint(lineA[0]), coerce3dpoint(lineA[1])
+    b0, b1 = coerce3dpoint(lineB[0]), coerce3dpoint(lineB[1])
+    params = _line_line(a0, a1, b0, b1)
+    if params is None:
+        return None
+    s, t = params
+    return a0 + (a1 - a0) * s, b0 + (b1 - b0) * t
+
+
+def CurveCurveIntersection(curveA, curveB=None, tolerance=-1):
+    tolerance = ABSOLUTE_TOLERANCE if tolerance <= 0 else tolerance
+    pts_a, pts_b = _curve(curveA).points, _curve(curveB).points
+    events = []
+    for i in range(len(pts_a) - 1):
+        a0, a1 = pts_a[i], pts_a[i + 1]
+        for j in range(len(pts_b) - 1):
+            b0, b1 = pts_b[j], pts_b[j + 1]
+            params = _line_line(a0, a1, b0, b1)
+            if params is None:
+                # Parallel: report an overlap when collinear and touching
+                if _segment_distance(a0, a1, b0) <= tolerance or _segment_distance(a0, a1, b1) <= tolerance:
+                    events.append((2, b0, b1, b0, b1, 0, 0, 0, 0, 0, 0))
+                continue
+            s, t = params
+            if -1e-9 <= s <= 1 + 1e-9 and -1e-9 <= t <= 1 + 1e-9:
+                pa = a0 + (a1 - a0) * s
+                pb = b0 + (b1 - b0) * t
+                if Distance(pa, pb) <= tolerance:
+                    events.append((1, pa, pa, pb, pb, s, s, t, t, t, t))
+    return events or None
+
+
+def _extend_to(points, side, target):
+    if side == 0:
+        points[0] = target
+    else:
+        points[-1] = target
+
+
+def ExtendCurve(curve_id, extension_type, side, boundary_object_ids):
+    curve = _curve(curve_id)
+    points = curve.points
+    if side == 0:
+        tip, base = points[0], points[1]
+    else:
+        tip, base = points[-1], points[-2]
+    direction = tip - base
+    best = None
+    for boundary_id in _ids(boundary_object_ids):
+        boundary = _curve(boundary_id).points
+        for j in range(len(boundary) - 1):
+            b0, b1 = boundary[j], boundary[j + 1]
+            params = _line_line(base, tip, b0, b1)
+            if params is None:
+                # Collinear boundary: extend to its nearest end beyond the tip
+                if _segment_distance(b0, b1, tip) > ABSOLUTE_TOLERANCE and \
+                        _length(_cross(direction, b0 - tip)) <= ABSOLUTE_TOLERANCE * _length(direction):
+                    for candidate in (b0, b1):
+                        along = _dot(candidate - tip, direction)
+                        if along > 0 and (best is None or along < best[0]):
+                            best = (along, candidate)
+                continue
+            s, t = params
+            if s > 1 and -1e-9 <= t <= 1 + 1e-9:
+                along = (s - 1) * _dot(direction, direction)
+                if best is None or along < best[0]:
+                    best = (along, base + direction * s)
+    if best is None:
+        return None
+    _extend_to(points, side, best[1])
+    return curve.id
+
+
+def ExtendCurvePoint(curve_id, side, point, extension_type=2):
+    curve = _curve(curve_id)
+    _extend_to(curve.points, side, coerce3dpoint(point))
+    return curve.id
+
+
+# ---------------------------------------------------------------------------
+# Bounding boxes and picking
+# ---------------------------------------------------------------------------
+
+def _object_points(obj, xform=None):
+    if obj.kind == 'instance':
+        instance_xform = obj.xform if xform is None else XformMultiply(xform, obj.xform)
+        points = []
+        for member_id in _doc.blocks[obj.block]:
+            points.extend(_object_points(_doc.objects[member_id], instance_xform))
+        return points
+    points = obj.points
+    if obj.kind == 'text':
+        width = len(obj.text or '') * obj.height * 0.6
+        points = [points[0], points[0] + (width, obj.height, 0)]
+    if xform is not None:
+        points = [_apply(xform, pt) for pt in points]
+    return points
+
+
+def BoundingBox(objects, view_or_plane=None, in_world_coords=True):
+    points = []
+    for obj_id in _ids(objects):
+        points.extend(_object_points(_get(obj_id)))
+    if not points:
+        return None
+    x0 = min(pt.X for pt in points)
+    y0 = min(pt.Y for pt in points)
+    z0 = min(pt.Z for pt in points)
+    x1 = max(pt.X for pt in points)
+    y1 = max(pt.Y for pt in points)
+    z1 = max(pt.Z for pt in points)
+    return [Point3d(x0, y0, z0), Point3d(x1, y0, z0), Point3d(x1, y1, z0), Point3d(x0, y1, z0),
+            Point3d(x0, y0, z1), Point3d(x1, y0, z1), Point3d(x1, y1, z1), Point3d(x0, y1, z1)]
+
+
+def WindowPick(corner1, corner2, view=None, select=False, in_window=True):
+    c1, c2 = coerce3dpoint(corner1), coerce3dpoint(corner2)
+    x0, x1 = min(c1.X, c2.X), max(c1.X, c2.X)
+    y0, y1 = min(c1.Y, c2.Y), max(c1.Y, c2.Y)
+    picked = []
+    for obj in _doc_objects():
+        if not _selectable(obj):
+            continue
+        points = _object_points(obj)
+        bx0 = min(pt.X for pt in points)
+        bx1 = max(pt.X for pt in points)
+        by0 = min(pt.Y for pt in points)
+        by1 = max(pt.Y for pt in points)
+        if in_window:
+            hit = x0 <= bx0 and bx1 <= x1 and y0 <= by0 and by1 <= y1
+        else:
+            hit = bx0 <= x1 and x0 <= bx1 and by0 <= y1 and y0 <= by1
+        if hit:
+            picked.append(obj.id)
+            if select:
+                obj.selected = True
+    return picked
+
+
+# ---------------------------------------------------------------------------
+# Blocks
+# ---------------------------------------------------------------------------
+
+def AddBlock(object_ids, base_point, name=None, delete_input=False):
+    base = coerce3dpoint(base_point)
+    to_origin = XformTranslation(-base)
+    members = []
+    for obj_id in _ids(object_ids):
+        member = _get(obj_id).copy()
+        _transform_obj(member, to_origin)
+        member.idef = name
+        members.append(_add(member))
+    _doc.blocks[name] = members
+    if delete_input:
+        DeleteObjects(object_ids)
+    return name
+
+
+def IsBlock(block_name):
+    return block_name in _doc.blocks
+
+
+def BlockNames(sort=False):
+    names = list(_doc.blocks)
+    if sort:
+        names.sort()
+    return names
+
+
+def BlockObjects(block_name):
+    return list(_doc.blocks[block_name])
+
+
+def BlockObjectCount(block_name):
+    return len(_doc.blocks[block_name])
+
+
+def IsBlockInstance(object_id):
+    obj = _find(object_id)
+    return obj is not None and obj.kind == 'instance'
+
+
+def BlockInstanceName(object_id):
+    return _get(object_id).block
+
+
+def BlockInstanceXform(object_id):
+    return [row[:] for row in _get(object_id).xform]
+
+
+def BlockInstances(block_name, where_to_look=0):
+    return [obj.id for obj in _doc_objects() if obj.kind == 'instance' and obj.block == block_name]
+
+
+def BlockInstanceCount(block_name, where_to_look=0):
+    count = len(BlockInstances(block_name))
+    if where_to_look:
+        for obj in _doc.objects.values():
+            if obj.idef is not None and obj.kind == 'instance' and obj.block == block_name:
+                count += 1
+    return count
+
+
+def BlockContainers(block_name):
+    containers = []
+    for name, members in _doc.blocks.items():
+        for member_id in members:
+            member = _doc.objects[member_id]
+            if member.kind == 'instance' and member.block == block_name:
+                containers.append(name)
+                break
+    return containers
+
+
+def InsertBlock2(block_name, xform):
+    if block_name not in _doc.blocks:
+        raise ValueError('block %r does not exist' % block_name)
+    obj = _Obj('instance', _doc.current_layer, [])
+    obj.block = block_name
+    obj.xform = [row[:] for row in xform]
+    return _add(obj)
+
+
+def InsertBlock(block_name, insertion_point, scale=(1, 1, 1), angle_degrees=0, rotation_normal=(0, 0, 1)):
+    xform = XformTranslation(insertion_point)
+    if angle_degrees:
+        xform = XformMultiply(xform, XformRotation2(angle_degrees, rotation_normal, (0, 0, 0)))
+    if tuple(scale) != (1, 1, 1):
+        scaling = XformIdentity()
+        for i in range(3):
+            scaling[i][i] = float(scale[i])
+        xform = XformMultiply(xform, scaling)
+    return InsertBlock2(block_name, xform)
+
+
+def ExplodeBlockInstance(object_id, explode_nested_instances=False):
+    instance = _get(object_id)
+    result = []
+    for member_id in _doc.blocks[instance.block]:
+        member = _doc.objects[member_id].copy()
+        _transform_obj(member, instance.xform)
+        if member.layer not in _doc.layers:
+            member.layer = instance.layer
+        # Attributes by parent (source 3) are the instance's
+        for attrs in (('color', 'color_source'), ('print_color', 'print_color_source'),
+                      ('print_width', 'print_width_source')):
+            if getattr(member, attrs[1]) == 3:
+                for attr in attrs:
+                    setattr(member, attr, getattr(instance, attr))
+        result.append(_add(member))
+    DeleteObject(object_id)
+    return result
+
+
+def DeleteBlock(block_name):
+    if block_name not in _doc.blocks:
+        return False
+    if BlockContainers(block_name):
+        return False
+    for obj_id in BlockInstances(block_name):
+        DeleteObject(obj_id)
+    for member_id in _doc.blocks.pop(block_name):
+        _doc.objects.pop(member_id, None)
+    return True
+
+
+reset()
@@ -0,0 +1,26 @@
+"""
+In-memory stand-in for the scriptcontext module, paired with the rhinoscriptsyntax stand-in.
+"""
+import rhinoscriptsyntax as _rs
+
+
+class _ActiveDoc(object):
+    """
+    Exposes the RhinoDoc members used by PresentationHelper.
+    """
+    def BeginUndoRecord(self, description):
+        doc = _rs.document()
+        doc.undo_serial += 1
+        doc.undo_records.append(description)
+        return doc.undo_serial
+
+    def EndUndoRecord(self, undo_record_serial_number):
+        return undo_record_serial_number == _rs.document().undo_serial
+
+    @property
+    def RuntimeSerialNumber(self):
+        return id(_rs.document())
+
+
+doc = _ActiveDoc()
+sticky = {}
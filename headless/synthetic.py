@@ -0,0 +1,135 @@
+"""
+Generator of parametric, Revit-export-like plans in the in-memory rhinoscriptsyntax document.
+
+A plan is a grid of rooms. Each room brings walls (shared walls are exported twice,
+like Revit does), a door and a window, a program hatch (some with off-by-one colors),
+a room label, a dashed overhead line, furniture block instances and an outline group
+with small gaps at the corners for "Extend curves to Closest Others".
+"""
+import random
+
+import rhinoscriptsyntax as rs
+
+
+OBJECTS_PER_ROOM = 15
+ROOM_SIZE = 20.0
+
+DWG_LAYERS = {'A-WALL-INTR': (0, 0, 0), 'A-WALL-EXTR': (0, 0, 0), 'A-DOOR': (0, 0, 255),
+              'A-GLAZ': (0, 255, 255), 'A-WALL-INTR-WIND': (255, 0, 0), 'A-FURN': (0, 255, 0),
+              'A-AREA-PATT': (255, 255, 255), 'A-ANNO-TEXT': (0, 0, 0), 'A-FLOR-OVHD': (127, 127, 127),
+              'A-ROOM-OUTL': (255, 0, 255), 'A-FURN-OVHD': (0, 255, 0), 'A-DOOR-OVHD': (0, 0, 255)}
+
+PROGRAM_COLORS = [(125, 189, 206), (178, 214, 222), (249, 161, 52), (247, 204, 120), (176, 136, 93),
+                  (136, 141, 182), (201, 125, 166), (251, 212, 213), (216, 217, 215), (253, 245, 210)]
+
+FAMILIES = ['Mobile Cabinet', 'Fixed Base', 'Wall Shelving', 'Grab Bar', 'Fire Extinguisher',
+            'Eyewash', 'Desk', 'Chair', 'Table', 'Sofa']
+
+
+def _add_layers():
+    for name, color in DWG_LAYERS.items():
+        rs.AddLayer(name, color)
+    for name in ('A-FLOR-OVHD', 'A-FURN-OVHD', 'A-DOOR-OVHD'):
+        rs.LayerLinetype(name, 'Dashed')
+
+
+def _add_families(rnd):
+    """
+    Define furniture families. Every family is exported under several names,
+    half of them with identical geometry, as Revit does for family types.
+    Returns the list of definition names.
+    """
+    rs.CurrentLayer('A-FURN')
+    names = []
+    nested = None
+    for index, family in enumerate(FAMILIES):
+        width = 2.0 + index * 0.5
+        depth = 1.5 + (index % 3) * 0.5
+        for variant in range(3):
+            if variant == 2:
+                width_v, depth_v = width + 0.25, depth
+            else:
+                width_v, depth_v = width, depth
+            ids = [rs.AddPolyline([(0, 0, 0), (width_v, 0, 0), (width_v, depth_v, 0), (0, depth_v, 0), (0, 0, 0)]),
+                   rs.AddLine((0, 0, 0), (width_v, depth_v, 0)),
+                   rs.AddLine((width_v * 0.5, 0, 0), (width_v * 0.5, depth_v, 0))]
+            if nested is not None and index % 4 == 0:
+                ids.append(rs.InsertBlock(nested, (width_v * 0.25, depth_v * 0.25, 0)))
+            name = '%s %d-%d' % (family, index, variant)
+            rs.AddBlock(ids, (0, 0, 0), name, delete_input=True)
+            names.append(name)
+        if nested is None:
+            nested = names[0]
+    rs.CurrentLayer('Default')
+    return names
+
+
+def make_plan(object_count, seed=0):
+    """
+    Reset the in-memory document and fill it with roughly object_count objects.
+
+    Returns:
+    A dictionary with the room outline group names ('groups') and the
+    furniture definition names ('families')
+    """
+    rs.reset()
+    rnd = random.Random(seed)
+    _add_layers()
+    families = _add_families(rnd)
+
+    rooms = max(1, object_count // OBJECTS_PER_ROOM)
+    columns = max(1, int(rooms ** 0.5))
+    groups = []
+    for room in range(rooms):
+        x0 = (room % columns) * ROOM_SIZE
+        y0 = (room // columns) * ROOM_SIZE
+        x1, y1 = x0 + ROOM_SIZE, y0 + ROOM_SIZE
+        exterior = room < columns or room % columns == 0
+
+        rs.CurrentLayer('A-WALL-EXTR' if exterior else 'A-WALL-INTR')
+        rs.AddLine((x0, y0, 0), (x1, y0, 0))
+        rs.AddLine((x0, y0, 0), (x0, y1, 0))
+        # The neighbour's wall, exported again and slightly shorter
+        rs.AddLine((x0 + 1, y0, 0), (x1 - 1, y0, 0))
+        rs.AddLine((x0, y0 + 0.1, 0), (x0, y1 - 0.1, 0))
+
+        rs.CurrentLayer('A-DOOR')
+        rs.AddLine((x0 + 2, y0, 0), (x0 + 2, y0 + 3, 0))
+        rs.CurrentLayer('A-WALL-INTR-WIND' if room % 2 else 'A-GLAZ')
+        rs.AddLine((x0 + 8, y0, 0), (x0 + 14, y0, 0))
+
+        rs.CurrentLayer('A-AREA-PATT')
+        boundary = rs.AddPolyline([(x0, y0, 0), (x1, y0, 0), (x1, y1, 0), (x0, y1, 0), (x0, y0, 0)])
+        hatch = rs.AddHatch(boundary, 'Solid')
+        rs.DeleteObject(boundary)
+        color = rnd.choice(PROGRAM_COLORS)
+        if rnd.random() < 0.2:
+            color = (color[0] + 1, color[1], max(0, color[2] - 1))
+        rs.ObjectColor(hatch, color)
+
+        rs.CurrentLayer('A-ANNO-TEXT')
+        rs.AddText('ROOM %d' % room, (x0 + 5, y0 + 10, 0), 1.0)
+
+        rs.CurrentLayer(('A-FLOR-OVHD', 'A-FURN-OVHD', 'A-DOOR-OVHD')[room % 3])
+        rs.AddLine((x0 + 1, y1 - 3, 0), (x1 - 1, y1 - 3, 0))
+
+        rs.CurrentLayer('A-FURN')
+        for slot in range(2):
+            name = rnd.choice(families)
+            point = (x0 + 4 + slot * 7, y0 + 5, 0)
+            if rnd.random() < 0.5:
+                rs.InsertBlock(name, point)
+            else:
+                rs.InsertBlock(name, point, angle_degrees=90)
+
+        rs.CurrentLayer('A-ROOM-OUTL')
+        gap = 0.5
+        outline = [rs.AddLine((x0 + 3, y0 + 3, 0), (x1 - 3 - gap, y0 + 3, 0)),
+                   rs.AddLine((x1 - 3, y0 + 3 + gap, 0), (x1 - 3, y1 - 3, 0)),
+                   rs.AddPolyline([(x1 - 3 - gap, y1 - 3, 0), (x0 + 3, y1 - 3, 0), (x0 + 3, y0 + 3 + gap, 0)])]
+        group = rs.AddGroup()
+        rs.AddObjectsToGroup(outline, group)
+        groups.append(group)
+
+    rs.CurrentLayer('Default')
+    return {'groups': groups, 'families': families}